@@ -0,0 +1,137 @@
+from arhc import ARHC
+from cache import CodebookCache
+from probability import ConstantProbability, AdaptiveProbability
+
+
+class LengthDistribution:
+
+    """
+    Exact mean and variance of the length of the compressed bits of N
+    independent bits that are one with probability p, without compressing
+    anything, by dynamic programming over the states that the ARHC builds
+    its symbol codes for.
+
+    The state of the static model is the number of bits left. A table of
+    the moments of every number of bits left is kept per model and extended
+    as longer inputs are asked for, so a sweep over N costs as much as its
+    largest N. The state of the adaptive model is the number of bits left
+    together with the number of ones seen, which makes the cost grow with
+    the square of N. States that are reached with a probability below
+    tolerance can be skipped, in which case a skipped state takes the
+    moments of the closest state with the same number of bits left.
+
+    :param cache:     Cache of symbol codes, a fresh CodebookCache by
+                      default.
+    :param tolerance: Probability below which states of the adaptive model
+                      are skipped, zero to keep all states.
+    """
+
+    def __init__(self, cache=None, tolerance=0.0):
+        self.cache = CodebookCache() if cache is None else cache
+        self.tolerance = tolerance
+        self.lengths = {}
+        self.runs = {}
+        self.tables = {}
+        self.results = {}
+
+    def calculate(self, p, N, adaptive=False, prob1=0.01, alpha0=0.5,
+                  alpha1=0.5, canonical=False):
+        """ Calculate the mean and the variance of the length of the
+            compressed bits. The remaining arguments are those of Header. """
+        key = (p, N, adaptive, prob1 if not adaptive else None,
+               (alpha0, alpha1) if adaptive else None, canonical)
+        if key not in self.results:
+            if adaptive:
+                self.results[key] = self.calculateAdaptive(
+                    p, N, alpha0, alpha1, canonical)
+            else:
+                self.results[key] = self.calculateStatic(p, N, prob1,
+                                                         canonical)
+        return self.results[key]
+
+    def getTransitions(self, arhc, p, bitsLeft):
+        """ Get the symbols that can follow in a state, as tuples of their
+            probability, the length of their code, the number of bits they
+            consume and the number of ones among them, in the order of the
+            number of zeros they start with. """
+        runLength = min(bitsLeft, arhc.calculateOptimalRunLength())
+        key = (runLength, arhc.getPredictive1(), arhc.canonical)
+        if key not in self.lengths:
+            arhc.buildHuffman(bitsLeft)
+            # The alphabet starts with the run without a one
+            lengths = [len(code) for code in arhc.huffman.codes]
+            self.lengths[key] = lengths[1:] + lengths[:1]
+        if (p, runLength) not in self.runs:
+            self.runs[p, runLength] = (
+                [pow(1 - p, run) * p for run in range(runLength)] +
+                [pow(1 - p, runLength)],
+                list(range(1, runLength + 1)) + [runLength],
+                [1] * runLength + [0])
+        probs, bits, ones = self.runs[p, runLength]
+        return zip(probs, self.lengths[key], bits, ones)
+
+    def calculateStatic(self, p, N, prob1, canonical):
+        """ Calculate the moments for the static model. """
+        key = (p, prob1, canonical)
+        if key not in self.tables:
+            self.tables[key] = ([0.0], [0.0])
+        means, squares = self.tables[key]
+        arhc = ARHC(ConstantProbability(prob1), self.cache, canonical)
+        for bitsLeft in range(len(means), N + 1):
+            mean, square = 0.0, 0.0
+            for prob, length, bits, _ in self.getTransitions(arhc, p,
+                                                             bitsLeft):
+                rest = bitsLeft - bits
+                mean += prob * (length + means[rest])
+                square += prob * (length * length +
+                                  2 * length * means[rest] + squares[rest])
+            means.append(mean)
+            squares.append(square)
+        return means[N], squares[N] - means[N] ** 2
+
+    def calculateAdaptive(self, p, N, alpha0, alpha1, canonical):
+        """ Calculate the moments for the adaptive model. """
+        arhc = ARHC(None, self.cache, canonical)
+
+        def getTransitions(bitsLeft, ones):
+            zeros = N - bitsLeft - ones
+            arhc.prob1 = AdaptiveProbability(alpha0 + zeros, alpha1 + ones)
+            return self.getTransitions(arhc, p, bitsLeft)
+
+        # Find the states that are reached, by the number of bits left
+        reached = [{} for _ in range(N + 1)]
+        reached[N][0] = 1.0
+        for bitsLeft in range(N, 0, -1):
+            if not reached[bitsLeft]:
+                continue
+            # The most likely state is always kept
+            threshold = min(self.tolerance, max(reached[bitsLeft].values()))
+            for ones, reach in list(reached[bitsLeft].items()):
+                if reach < threshold:
+                    del reached[bitsLeft][ones]
+                    continue
+                for prob, _, bits, one in getTransitions(bitsLeft, ones):
+                    states = reached[bitsLeft - bits]
+                    states[ones + one] = states.get(ones + one, 0.0) + \
+                        reach * prob
+
+        # Find the moments of the states, from the end of the input back
+        moments = [dict((ones, (0.0, 0.0)) for ones in reached[0])]
+        for bitsLeft in range(1, N + 1):
+            moments.append({})
+            for ones in reached[bitsLeft]:
+                mean, square = 0.0, 0.0
+                for prob, length, bits, one in getTransitions(bitsLeft,
+                                                              ones):
+                    rest = moments[bitsLeft - bits]
+                    if ones + one in rest:
+                        restMean, restSquare = rest[ones + one]
+                    else:
+                        restMean, restSquare = rest[min(
+                            rest, key=lambda other: abs(other - ones - one))]
+                    mean += prob * (length + restMean)
+                    square += prob * (length * length +
+                                      2 * length * restMean + restSquare)
+                moments[bitsLeft][ones] = (mean, square)
+        mean, square = moments[N][0]
+        return mean, square - mean ** 2
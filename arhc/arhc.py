@@ -1,6 +1,9 @@
 import math
 from leaf import Leaf
 from huffman import Huffman
+from canonical import CanonicalHuffman
+from cache import CodebookCache
+from stream import binary, readBinary
 
 
 class ARHC:
@@ -8,50 +11,260 @@ class ARHC:
     """
     Implementation of Adaptive Run-length Huffman Compressor.
 
-    :param prob1: Probability of one.
+    Symbols of the alphabet are named by their position: the run of
+    runLength zeros first, then the runs of fewer zeros terminated by a one
+    in order of length. Runs are thus kept as numbers, and strings of bits
+    are only formed for the decompressed output.
+
+    In streaming mode the number of bits need not be known. The alphabet then
+    includes a symbol of small probability that marks the end of the stream,
+    after which follow the trailing zeros that are not terminated by a one,
+    in binary.
+
+    The probability model is updated once per symbol with the numbers of
+    zeros and ones of the symbol, unless it declares that it needs to observe
+    every bit that is read or written.
+
+    Counters and timers of the hot path are recorded into stats if it is set
+    to a Stats object.
+
+    A code that is not in the cache is built unless the last Huffman code
+    built for the same alphabet has the same tree for the new probabilities,
+    in which case that code is reused. Slowly drifting probabilities rarely
+    change the order in which the Huffman algorithm merges symbols, so the
+    adaptive model mostly reuses codes, and reuse yields exactly the codes
+    that building them would.
+
+    Canonical symbol codes have the code lengths of Huffman codes but other
+    code symbols, so they compress to different bits.
+
+    :param prob1:     Probability of one.
+    :param cache:     Cache of symbol codes, a fresh CodebookCache by
+                      default.
+    :param canonical: Use canonical symbol codes, stored in flat arrays,
+                      instead of Huffman trees.
     """
 
-    def __init__(self, prob1):
+    endProb = 2 ** -20
+
+    def __init__(self, prob1, cache=None, canonical=False):
         self.prob1 = prob1
+        self.cache = CodebookCache() if cache is None else cache
+        self.canonical = canonical
+        self.stats = None
+        self.lastCode = None
+        self.reuses = 0
+
+    def getPredictive1(self):
+        """ Get the predictive probability of one that codes are built
+            for. """
+        return self.cache.quantize(self.prob1.getPredictive1())
 
     def calculateOptimalRunLength(self):
         """ Calculate the optimal run-length. """
         return max(1, int(round(math.log(0.5) /
-                         math.log(1 - self.prob1.getPredictive1()))))
+                         math.log(1 - self.getPredictive1()))))
+
+    def buildProbs(self, runLength):
+        """ Get the probabilities of the symbols of an alphabet encoding
+            run-lengths. """
+        prob1 = self.getPredictive1()
+        return [pow(1 - prob1, runLength)] + \
+            [pow(1 - prob1, i) * prob1 for i in range(runLength)]
 
     def buildSymbols(self, runLength):
         """ Build an alphabet encoding run-lengths. """
-        symbols = [Leaf(
-            '0' * runLength,
-            pow(1 - self.prob1.getPredictive1(), runLength)
-        )]
-        for i in range(runLength):
-            symbols.append(Leaf(
-                '0' * i + '1',
-                pow(1 - self.prob1.getPredictive1(), i) *
-                    self.prob1.getPredictive1()
-            ))
-        return symbols
+        return [Leaf(i, prob)
+                for i, prob in enumerate(self.buildProbs(runLength))]
 
     def buildHuffman(self, bitsLeft):
         """ Build a Huffman symbol code from an alphabet that encodes
-            run-lengths. """
-        runLength = min(bitsLeft, self.calculateOptimalRunLength())
+            run-lengths, or reuse it from the cache. """
+        self.runLength = min(bitsLeft, self.calculateOptimalRunLength())
+        self.huffman = self.cache.get(
+            self.getKey(self.runLength, self.getPredictive1()),
+            lambda: self.createCode(self.runLength, False))
+
+    def buildStreamingHuffman(self):
+        """ Build a Huffman symbol code from an alphabet that encodes
+            run-lengths and the end of the stream, or reuse it from the
+            cache. """
+        self.runLength = self.calculateOptimalRunLength()
+        self.huffman = self.cache.get(
+            self.getKey(self.runLength, self.getPredictive1(), 'end'),
+            lambda: self.createCode(self.runLength, True))
+
+    def getKey(self, *key):
+        """ Get the key of a symbol code in the cache, which distinguishes
+            canonical codes from Huffman codes. """
+        return key + ('canonical',) if self.canonical else key
+
+    def createCode(self, runLength, end):
+        """ Construct the symbol code of the alphabet of a run-length, with
+            or without the end of the stream, or reuse the last Huffman code
+            of the alphabet if it has the same tree. """
+        alphabet = (runLength, end)
+        if not self.canonical and self.lastCode is not None and \
+                self.lastCode[0] == alphabet:
+            probs = self.buildProbs(runLength) + ([self.endProb] if end
+                                                  else [])
+            if self.lastCode[1].matches(probs):
+                self.reuses += 1
+                return self.lastCode[1]
         symbols = self.buildSymbols(runLength)
-        self.huffman = Huffman(symbols)
+        if end:
+            symbols.append(Leaf(runLength + 1, self.endProb))
+        if self.canonical:
+            return CanonicalHuffman(symbols)
+        huffman = Huffman(symbols)
+        self.lastCode = (alphabet, huffman)
+        return huffman
+
+    def encodeRun(self, run):
+        """ Get the code symbol of a run of zeros, which is terminated by a
+            one if it is shorter than the run-length. """
+        # The alphabet starts with the run without a one
+        return self.huffman.codes[(run + 1) % (self.runLength + 1)]
+
+    def decodeRun(self, symbol):
+        """ Get the numbers of zeros and ones of the run that a symbol of the
+            alphabet encodes. """
+        # The alphabet starts with the run without a one
+        if symbol == 0:
+            return self.runLength, 0
+        return symbol - 1, 1
 
     def compress(self, inStream, outStream):
         """ Compress the contents of a stream and write the compressed
-            contents to another stream. """
-        inStream.observeRead(self.prob1.observe)
+            contents to another stream. Raises a ValueError if the stream
+            ends before its number of bits is read. """
+        bitLevel, stats = self.prob1.bitLevel, self.stats
+        if bitLevel:
+            inStream.observeRead(self.prob1.observe)
         while inStream.bitsLeftToRead() > 0:
+            if stats is not None:
+                stats.startBuild(self)
             self.buildHuffman(inStream.bitsLeftToRead())
-            outStream.write(self.huffman.encode(inStream))
+            if stats is not None:
+                stats.endBuild(self)
+            bitsRead = inStream.bitsRead
+            run = inStream.readRun(self.runLength)
+            ones = inStream.bitsRead - bitsRead - run
+            if run + ones == 0:
+                raise ValueError('input shorter than N = {} bits'.format(
+                    inStream.N))
+            code = self.encodeRun(run)
+            if stats is not None:
+                stats.endSymbol(self, run, ones, len(code))
+            if not bitLevel:
+                self.prob1.observeCounts(run, ones)
+            outStream.write(code)
+        outStream.finish()
+        if stats is not None:
+            stats.endStreams(inStream, outStream)
 
     def decompress(self, inStream, outStream):
         """ Decompress the contents of a stream and write the decompressed
             contents to another stream. """
-        outStream.observeWrite(self.prob1.observe)
+        bitLevel, stats = self.prob1.bitLevel, self.stats
+        if bitLevel:
+            outStream.observeWrite(self.prob1.observe)
         while outStream.bitsLeftToWrite() > 0:
+            if stats is not None:
+                stats.startBuild(self)
             self.buildHuffman(outStream.bitsLeftToWrite())
-            outStream.write(self.huffman.decode(inStream))
+            if stats is not None:
+                stats.endBuild(self)
+            bitsRead = inStream.bitsRead
+            zeros, ones = self.decodeRun(self.huffman.decode(inStream))
+            if stats is not None:
+                stats.endSymbol(self, zeros, ones,
+                                inStream.bitsRead - bitsRead)
+            if not bitLevel:
+                self.prob1.observeCounts(zeros, ones)
+            outStream.write('0' * zeros + '1' * ones)
+        outStream.finish()
+        if stats is not None:
+            stats.endStreams(inStream, outStream)
+
+    def compressStreaming(self, inStream, outStream):
+        """ Compress the contents of a stream up to its end and write the
+            compressed contents to another stream. """
+        for code in self.iterCompressStreaming(inStream):
+            outStream.write(code)
+        outStream.finish()
+        if self.stats is not None:
+            self.stats.endStreams(inStream, outStream)
+
+    def iterCompressStreaming(self, inStream):
+        """ Compress the contents of a stream up to its end, yielding the
+            compressed contents symbol by symbol. """
+        bitLevel, stats = self.prob1.bitLevel, self.stats
+        if bitLevel:
+            inStream.observeRead(self.prob1.observe)
+        while True:
+            if stats is not None:
+                stats.startBuild(self)
+            self.buildStreamingHuffman()
+            if stats is not None:
+                stats.endBuild(self)
+            bitsRead = inStream.bitsRead
+            run = inStream.readRun(self.runLength)
+            ones = inStream.bitsRead - bitsRead - run
+            if run < self.runLength and ones == 0:
+                break
+            code = self.encodeRun(run)
+            if stats is not None:
+                stats.endSymbol(self, run, ones, len(code))
+            if not bitLevel:
+                self.prob1.observeCounts(run, ones)
+            yield code
+        yield self.huffman.codes[self.runLength + 1] + \
+            binary(run, (self.runLength - 1).bit_length())
+
+    def iterDecompressStreaming(self, inStream):
+        """ Decompress the contents of a stream compressed in streaming mode,
+            yielding the decompressed contents symbol by symbol. Raises a
+            ValueError if the stream ends before the end of the stream is
+            decoded. """
+        bitLevel, stats = self.prob1.bitLevel, self.stats
+        while True:
+            if stats is not None:
+                stats.startBuild(self)
+            self.buildStreamingHuffman()
+            if stats is not None:
+                stats.endBuild(self)
+            bitsRead = inStream.bitsRead
+            symbol = self.huffman.decode(inStream)
+            # An exhausted stream decodes to a symbol whose code is cut short
+            if inStream.bitsRead - bitsRead < len(self.huffman.codes[symbol]):
+                raise ValueError('truncated stream')
+            if symbol == self.runLength + 1:
+                width = (self.runLength - 1).bit_length()
+                bitsRead = inStream.bitsRead
+                run = readBinary(inStream, width)
+                if inStream.bitsRead - bitsRead < width:
+                    raise ValueError('truncated stream')
+                yield '0' * run
+                return
+            zeros, ones = self.decodeRun(symbol)
+            if stats is not None:
+                stats.endSymbol(self, zeros, ones,
+                                inStream.bitsRead - bitsRead)
+            bits = '0' * zeros + '1' * ones
+            # No stream is written to observe, so a model that observes
+            # every bit is given the bits of the symbol
+            if bitLevel:
+                self.prob1.observe(bits)
+            else:
+                self.prob1.observeCounts(zeros, ones)
+            yield bits
+
+    def decompressStreaming(self, inStream, outStream):
+        """ Decompress the contents of a stream compressed in streaming mode
+            and write the decompressed contents to another stream. """
+        for symbol in self.iterDecompressStreaming(inStream):
+            outStream.write(symbol)
+        outStream.finish()
+        if self.stats is not None:
+            self.stats.endStreams(inStream, outStream)
@@ -0,0 +1,110 @@
+import mmap
+import struct
+from arhc import ARHC
+from cache import CodebookCache
+from huffman import Huffman
+from probability import ConstantProbability
+from stream import binary
+
+
+class CodebookBank:
+
+    """
+    Precomputed symbol codes of the ARHC for every point of a grid that the
+    probability of one is quantized onto, and for every run-length up to the
+    optimal run-length of that point. The bank is stored in a binary file
+    that is memory-mapped, such that processes that load the same file
+    share it, and a symbol code is only read from it when it is used.
+
+    The file starts with a magic number, the version, the number of grid
+    points and the number of symbol codes. Then follow the index of the
+    first symbol code of every grid point and the byte offset of every
+    symbol code, after which the code symbols of all symbol codes follow as
+    pairs of a length and a value, in the order of the alphabet.
+
+    :param path: Path of the file that stores the bank.
+    """
+
+    magic = b'ARHB'
+    version = 1
+    headerFormat = '>BII'
+    entryFormat = '>BI'
+    maxCodeLength = 32
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.contents[:len(self.magic)] != self.magic:
+            raise ValueError('not an ARHC codebook bank')
+        position = len(self.magic)
+        version, self.quantization, count = struct.unpack_from(
+            self.headerFormat, self.contents, position)
+        if version != self.version:
+            raise ValueError('unsupported version {}'.format(version))
+        position += struct.calcsize(self.headerFormat)
+        self.starts = struct.unpack_from(
+            '>{}I'.format(self.quantization + 1), self.contents, position)
+        position += 4 * (self.quantization + 1)
+        self.offsets = struct.unpack_from('>{}Q'.format(count + 1),
+                                          self.contents, position)
+        self.entries = position + 8 * (count + 1)
+        self.loads = 0
+
+    def __deepcopy__(self, memo):
+        # The contents are read-only, so copies can share them
+        return self
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def getHuffman(self, runLength, prob1):
+        """ Get the symbol code of a run-length and a quantized probability of
+            one, or None if it is not in the bank. """
+        cell = min(self.quantization - 1, int(prob1 * self.quantization))
+        index = self.starts[cell] + runLength - 1
+        if runLength < 1 or index >= self.starts[cell + 1]:
+            return None
+        self.loads += 1
+        start = self.entries + self.offsets[index]
+        values = struct.unpack_from(
+            '>' + self.entryFormat[1:] * (runLength + 1), self.contents,
+            start)
+        codes = [binary(values[i + 1], values[i])
+                 for i in range(0, len(values), 2)]
+        return Huffman.fromEncoding(list(range(runLength + 1)), codes)
+
+    def close(self):
+        """ Unmap the file. """
+        self.contents.close()
+
+    @classmethod
+    def write(cls, path, quantization):
+        """ Compute the symbol codes for a grid of a number of points and
+            store them in a file. """
+        cache = CodebookCache(0, quantization)
+        starts, offsets, entries = [0], [0], []
+        for cell in range(quantization):
+            arhc = ARHC(ConstantProbability((cell + 0.5) / quantization),
+                        cache)
+            for runLength in range(1, arhc.calculateOptimalRunLength() + 1):
+                codes = Huffman(arhc.buildSymbols(runLength)).codes
+                if max(len(code) for code in codes) > cls.maxCodeLength:
+                    raise ValueError('code symbols longer than {} bits'
+                                     .format(cls.maxCodeLength))
+                entries.append(b''.join(
+                    struct.pack(cls.entryFormat, len(code), int(code, 2))
+                    for code in codes))
+                offsets.append(offsets[-1] + len(entries[-1]))
+            starts.append(len(entries))
+        with open(path, 'wb') as f:
+            f.write(cls.magic)
+            f.write(struct.pack(cls.headerFormat, cls.version, quantization,
+                                len(entries)))
+            f.write(struct.pack('>{}I'.format(len(starts)), *starts))
+            f.write(struct.pack('>{}Q'.format(len(offsets)), *offsets))
+            for entry in entries:
+                f.write(entry)
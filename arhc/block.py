@@ -0,0 +1,134 @@
+import copy
+from multiprocessing import Pool
+from stats import Stats
+from stream import Stream, binary, readBinary
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Blocks:
+
+    """
+    Compression of a stream in blocks of a fixed number of bits. Every block
+    is compressed independently by a fresh copy of a compressor, including
+    its probability model, such that the blocks can be compressed and
+    decompressed concurrently by a pool of processes. The compressed blocks
+    are preceded by an index of their lengths. If the compressor has stats,
+    the stats of all blocks are added to them.
+
+    :param engine:    Compressor, such as an ARHC, that is copied for every
+                      block.
+    :param blockSize: Number of bits per block.
+    :param jobs:      Number of processes.
+    """
+
+    indexBits = 32
+
+    def __init__(self, engine, blockSize, jobs=1):
+        self.engine = engine
+        self.blockSize = blockSize
+        self.jobs = jobs
+
+    def getBlockSizes(self, N):
+        """ Get the number of bits of every block of a stream. """
+        return [min(self.blockSize, N - i)
+                for i in range(0, N, self.blockSize)]
+
+    def map(self, function, tasks):
+        """ Apply a function to all tasks, in a pool of processes if more than
+            one job is requested. """
+        if self.jobs <= 1:
+            return list(map(function, tasks))
+        pool = Pool(self.jobs)
+        try:
+            return pool.map(function, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    def compressBlocks(self, inStream):
+        """ Compress the contents of a stream block by block. Returns the
+            compressed blocks. Raises a ValueError if the stream ends before
+            its number of bits is read. """
+        tasks = [(self.engine, inStream.read(size))
+                 for size in self.getBlockSizes(inStream.bitsLeftToRead())]
+        if inStream.bitsLeftToRead() > 0:
+            raise ValueError('input shorter than N = {} bits'.format(
+                inStream.N))
+        return self.mergeStats(self.map(compressBlock, tasks))
+
+    def decompressBlocks(self, codes, sizes):
+        """ Decompress compressed blocks of known sizes. Returns the
+            blocks. """
+        tasks = [(self.engine, code, size) for code, size in zip(codes, sizes)]
+        return self.mergeStats(self.map(decompressBlock, tasks))
+
+    def mergeStats(self, results):
+        """ Add the stats of the blocks to those of the compressor. Returns
+            the compressed or decompressed blocks. """
+        stats = getattr(self.engine, 'stats', None)
+        if stats is not None:
+            for _, blockStats in results:
+                stats.merge(blockStats)
+        return [block for block, _ in results]
+
+    def compress(self, inStream, outStream):
+        """ Compress the contents of a stream and write the compressed
+            contents to another stream. Raises a ValueError if the length of
+            a compressed block does not fit in the index. """
+        codes = self.compressBlocks(inStream)
+        for code in codes:
+            if len(code) >> self.indexBits:
+                raise ValueError('compressed block of {} bits too long for '
+                                 'the index, use a smaller block '
+                                 'size'.format(len(code)))
+        outStream.write(''.join(binary(len(code), self.indexBits)
+                                for code in codes))
+        for code in codes:
+            outStream.write(code)
+        outStream.finish()
+
+    def decompress(self, inStream, outStream):
+        """ Decompress the contents of a stream and write the decompressed
+            contents to another stream. """
+        sizes = self.getBlockSizes(outStream.bitsLeftToWrite())
+        lengths = [readBinary(inStream, self.indexBits) for _ in sizes]
+        codes = [inStream.read(length) for length in lengths]
+        for block in self.decompressBlocks(codes, sizes):
+            outStream.write(block)
+        outStream.finish()
+
+
+def copyEngine(engine):
+    """ Copy a compressor, giving the copy fresh stats if it has any. Its
+        cache of symbol codes is shared rather than copied, such that codes
+        built for one block are reused by the next. """
+    cache = getattr(engine, 'cache', None)
+    engine = copy.deepcopy(engine, {} if cache is None else {id(cache): cache})
+    if getattr(engine, 'stats', None) is not None:
+        engine.stats = Stats()
+    return engine
+
+
+def compressBlock(task):
+    """ Compress a block of bits with a fresh copy of a compressor. Returns
+        the compressed block and the stats of the copy. """
+    engine, bits = task
+    engine = copyEngine(engine)
+    output = StringIO()
+    engine.compress(Stream(StringIO(bits), len(bits)),
+                    Stream(output, len(bits)))
+    return output.getvalue(), getattr(engine, 'stats', None)
+
+
+def decompressBlock(task):
+    """ Decompress a block of bits with a fresh copy of a compressor. Returns
+        the decompressed block and the stats of the copy. """
+    engine, code, size = task
+    engine = copyEngine(engine)
+    output = StringIO()
+    engine.decompress(Stream(StringIO(code), size), Stream(output, size))
+    return output.getvalue(), getattr(engine, 'stats', None)
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+
+class CodebookCache:
+
+    """
+    Least-recently-used cache of symbol codes, keyed by the run-length and
+    the predictive probability of one that a code is built for. Optionally
+    quantizes the predictive probability onto a grid of equally spaced
+    points, such that slowly drifting probabilities share codes. Codes that
+    are not present are taken from a bank of precomputed codes for the grid
+    if one is given, and built otherwise.
+
+    :param size:         Maximum number of codes kept in the cache.
+    :param quantization: Number of grid points to quantize the probability of
+                         one onto, or None to key on the exact probability.
+    :param bank:         CodebookBank for the same grid, or None.
+    """
+
+    def __init__(self, size=1024, quantization=None, bank=None):
+        if bank is not None and bank.quantization != quantization:
+            raise ValueError('codebook bank has {} grid points instead of {}'
+                             .format(bank.quantization, quantization))
+        self.size = size
+        self.quantization = quantization
+        self.bank = bank
+        self.codebooks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, prob1):
+        """ Map a probability of one onto the midpoint of its grid cell. """
+        if not self.quantization:
+            return prob1
+        cell = min(self.quantization - 1, int(prob1 * self.quantization))
+        return (cell + 0.5) / self.quantization
+
+    def get(self, key, build):
+        """ Get the code stored under a key, building it with a function and
+            storing it if it is not present. """
+        if key in self.codebooks:
+            self.hits += 1
+            codebook = self.codebooks.pop(key)
+        else:
+            self.misses += 1
+            codebook = None
+            # The bank holds Huffman codes without an end of the stream only
+            if self.bank is not None and len(key) == 2:
+                codebook = self.bank.getHuffman(*key)
+            if codebook is None:
+                codebook = build()
+            if self.size > 0 and len(self.codebooks) >= self.size:
+                self.codebooks.popitem(last=False)
+        if self.size > 0:
+            self.codebooks[key] = codebook
+        return codebook
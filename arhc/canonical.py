@@ -0,0 +1,109 @@
+from array import array
+from bisect import bisect_right
+
+
+class CanonicalHuffman:
+
+    """
+    Canonical symbol code with the code lengths of the Huffman algorithm.
+    Code symbols are assigned in order of length and, among symbols of the
+    same length, in the order of the alphabet, so the code follows from the
+    code lengths alone. It is stored in flat integer arrays instead of a
+    tree: the code length of every symbol, the symbols ordered by code
+    symbol, and the first code symbol and the position in that order of the
+    first symbol of every length.
+
+    Decoding looks up the length of the next code symbol by bisecting the
+    left-aligned code symbols that end every length, after which the
+    symbol follows by arithmetic.
+
+    The code symbols are available both by symbol, in encoding, and by the
+    position of the symbol in the alphabet, in codes.
+
+    :param symbols: List of symbols that represents the alphabet.
+    """
+
+    def __init__(self, symbols):
+        self.build([symbol.symbol for symbol in symbols],
+                   calculateLengths([symbol.getProb() for symbol in symbols]))
+
+    def build(self, names, lengths):
+        """ Assign the code symbols of the symbols of the alphabet from their
+            code lengths. """
+        self.names = names
+        self.lengths = array('B', lengths)
+        self.maxLength = max(lengths)
+        counts = [0] * (self.maxLength + 1)
+        for length in lengths:
+            counts[length] += 1
+        # Sorting is stable, so symbols of the same length stay in order
+        self.order = array('I', sorted(range(len(lengths)),
+                                       key=lengths.__getitem__))
+        self.firstCodes = array('L', [0] * (self.maxLength + 1))
+        self.offsets = array('I', [0] * (self.maxLength + 1))
+        self.limits = array('L', [0] * self.maxLength)
+        code, offset = 0, 0
+        for length in range(1, self.maxLength + 1):
+            self.firstCodes[length] = code
+            self.offsets[length] = offset
+            self.limits[length - 1] = (code + counts[length]) << \
+                (self.maxLength - length)
+            code = (code + counts[length]) << 1
+            offset += counts[length]
+        self.values = array('L', [0] * len(lengths))
+        for rank, i in enumerate(self.order):
+            length = lengths[i]
+            self.values[i] = self.firstCodes[length] + rank - \
+                self.offsets[length]
+        self.codes = [format(value, 'b').zfill(length) if length else ''
+                      for value, length in zip(self.values, lengths)]
+        self.encoding = dict(zip(names, self.codes))
+
+    def decode(self, stream):
+        """ Decode the first code symbol encountered in a stream by the name of
+            its symbol, waiting for further bits only if the code symbol
+            needs them. """
+        maxLength = self.maxLength
+        if maxLength == 0:
+            return self.names[0]
+        bits = stream.peek(maxLength)
+        value = int(bits.ljust(maxLength, '0'), 2)
+        length = bisect_right(self.limits, value) + 1
+        while length > len(bits) and stream.fill(len(bits) + 1):
+            bits = stream.peek(maxLength)
+            value = int(bits.ljust(maxLength, '0'), 2)
+            length = bisect_right(self.limits, value) + 1
+        stream.read(length)
+        rank = (value >> (maxLength - length)) - self.firstCodes[length]
+        return self.names[self.order[self.offsets[length] + rank]]
+
+
+def calculateLengths(probs):
+    """ Calculate the code lengths of the Huffman algorithm for symbols of
+        given probabilities, without building a tree of objects. The symbols
+        are sorted once, after which merged pairs, which are created in
+        order of ascending probability, are kept in a second queue. """
+    if len(probs) == 1:
+        return [0]
+    leaves = sorted(range(len(probs)), key=probs.__getitem__)
+    parents = [0] * (2 * len(probs) - 1)
+    merged = []
+    i = j = 0
+    for node in range(len(probs), len(parents)):
+        prob = 0.0
+        for _ in range(2):
+            if j < len(merged) and (i == len(leaves) or
+                                    merged[j] <= probs[leaves[i]]):
+                parents[len(probs) + j] = node
+                prob += merged[j]
+                j += 1
+            else:
+                parents[leaves[i]] = node
+                prob += probs[leaves[i]]
+                i += 1
+        merged.append(prob)
+    # Parents are created after their children, so depths follow backwards
+    depths = [0] * len(parents)
+    for k in range(len(parents) - 2, -1, -1):
+        depths[k] = depths[parents[k]] + 1
+    return depths[:len(probs)]
@@ -0,0 +1,307 @@
+import io
+from cache import CodebookCache
+from container import Container, Header
+from stream import Stream
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def compress(data, packed=True, adaptive=False, prob1=0.01, alpha0=0.5,
+             alpha1=0.5, engine='huffman', quantize=0, blockSize=0, jobs=1,
+             cache=None):
+    """ Compress bytes to a container. In packed mode every byte holds eight
+        bits, most significant bit first; otherwise every bit is one of the
+        characters '0' and '1'. The remaining arguments are those of Header
+        and Container. """
+    N = len(data) * 8 if packed else len(b''.join(data.split()))
+    header = Header(N, adaptive, prob1, alpha0, alpha1, engine, quantize,
+                    packed, blockSize)
+    channel = io.BytesIO()
+    Container(header, jobs, cache).compress(
+        Stream(io.BytesIO(data), N, packed), channel)
+    return channel.getvalue()
+
+
+def decompress(data, jobs=1, cache=None):
+    """ Decompress a container, or a sequence of containers, to bytes. """
+    channel = io.BytesIO(data)
+    contents = []
+    container = Container.readNext(channel, jobs, cache)
+    while container is not None:
+        contents.append(decompressContainer(container, channel))
+        container = Container.readNext(channel, jobs, cache)
+    return b''.join(contents)
+
+
+def decompressContainer(container, channel):
+    """ Decompress a container of which the index has been read from a
+        channel of bytes. """
+    packed = container.header.packed
+    output = io.BytesIO() if packed else StringIO()
+    container.decompress(channel, Stream(output, container.header.N, packed,
+                                         'throughput'))
+    contents = output.getvalue()
+    return contents if isinstance(contents, bytes) else \
+        contents.encode('ascii')
+
+
+def iterCompress(chunks, packed=True, adaptive=False, prob1=0.01,
+                 alpha0=0.5, alpha1=0.5, engine='huffman', quantize=0,
+                 chunkSize=1 << 16, cache=None):
+    """ Compress an iterable of chunks of bytes in streaming mode, yielding
+        chunks of compressed bytes of about chunkSize bytes. In packed mode
+        every byte holds eight bits, most significant bit first; otherwise
+        every bit is one of the characters '0' and '1'. Compressed bytes are
+        always packed. The input is consumed as the output is taken, so
+        memory stays bounded however many bits pass. Decompression takes
+        the same arguments. """
+    arhc = createStreamingEngine(adaptive, prob1, alpha0, alpha1, engine,
+                                 quantize, cache)
+    inStream = Stream(ChunkChannel(chunks), None, packed)
+    inStream.chunkSize = chunkSize
+    return iterStream(arhc.iterCompressStreaming(inStream), True, chunkSize)
+
+
+def iterDecompress(chunks, packed=True, adaptive=False, prob1=0.01,
+                   alpha0=0.5, alpha1=0.5, engine='huffman', quantize=0,
+                   chunkSize=1 << 16, cache=None):
+    """ Decompress an iterable of chunks of compressed bytes, as yielded by
+        iterCompress with the same arguments, yielding chunks of bytes of
+        about chunkSize bytes. """
+    arhc = createStreamingEngine(adaptive, prob1, alpha0, alpha1, engine,
+                                 quantize, cache)
+    inStream = Stream(ChunkChannel(chunks), None, True)
+    inStream.chunkSize = chunkSize
+    return iterStream(arhc.iterDecompressStreaming(inStream), packed,
+                      chunkSize)
+
+
+def createStreamingEngine(adaptive, prob1, alpha0, alpha1, engine, quantize,
+                          cache):
+    """ Create a compressor that supports streaming mode. """
+    if engine not in ['huffman', 'canonical']:
+        raise ValueError('streaming mode requires Huffman codes')
+    return Header(None, adaptive, prob1, alpha0, alpha1, engine,
+                  quantize).createEngine(cache)
+
+
+def iterStream(strings, packed, chunkSize):
+    """ Write strings of bits to a stream, yielding the bytes written in
+        chunks whenever about chunkSize bytes are pending. """
+    sink = ChunkSink()
+    outStream = Stream(sink, None, packed, 'throughput')
+    outStream.bufferBits = chunkSize * 8 if packed else chunkSize
+    for string in strings:
+        outStream.write(string)
+        if sink.chunks:
+            for chunk in sink.take():
+                yield chunk
+    outStream.finish()
+    for chunk in sink.take():
+        yield chunk
+
+
+class ChunkChannel:
+
+    """
+    Input channel that reads from an iterable of chunks of bytes, returning
+    no more than is asked for and keeping the remainder of a chunk.
+
+    :param chunks: Iterable of chunks of bytes.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = b''
+        self.offset = 0
+
+    def read1(self, size):
+        """ Read up to a number of bytes, taking at most one chunk. """
+        if self.offset == len(self.chunk):
+            self.chunk = next(self.chunks, b'')
+            self.offset = 0
+        contents = self.chunk[self.offset:self.offset + size]
+        self.offset += len(contents)
+        return contents
+
+    def read(self, size):
+        """ Read up to a number of bytes. """
+        return self.read1(size)
+
+
+class ChunkSink:
+
+    """
+    Output channel that collects the chunks written to it until they are
+    taken.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, contents):
+        """ Collect bytes or ASCII characters. """
+        if not isinstance(contents, bytes):
+            contents = contents.encode('ascii')
+        self.chunks.append(contents)
+
+    def flush(self):
+        """ Do nothing since chunks are kept until they are taken. """
+        pass
+
+    def take(self):
+        """ Take the collected chunks. """
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+class ARHCFile(io.BufferedIOBase):
+
+    """
+    File object that compresses the bytes written to it and decompresses the
+    bytes read from it, like gzip.GzipFile. The file is a sequence of
+    containers, called members, of packed bits. Written bytes are compressed
+    to a member whenever memberSize bytes are collected and when the file is
+    closed, and bytes are read by decompressing one member at a time, such
+    that neither requires all contents in memory.
+
+    :param filename:   Name of the file, which is used if fileobj is None.
+    :param mode:       'rb' to read, 'wb' to write or 'ab' to append.
+    :param fileobj:    File object of bytes to read from or write to instead
+                       of the named file.
+    :param memberSize: Number of bytes compressed to a member when writing.
+    :param jobs:       Number of processes that compress or decompress
+                       blocks.
+    :param options:    Options of compress, such as adaptive and prob1, used
+                       when writing.
+    """
+
+    modes = ['rb', 'wb', 'ab']
+    memberSize = 1 << 20
+
+    def __init__(self, filename=None, mode='rb', fileobj=None,
+                 memberSize=None, jobs=1, **options):
+        if mode not in self.modes:
+            raise ValueError('unsupported mode "{}"'.format(mode))
+        self.ownsFileobj = fileobj is None
+        self.fileobj = io.open(filename, mode) if fileobj is None else fileobj
+        self.mode = mode
+        if memberSize is not None:
+            self.memberSize = memberSize
+        self.jobs = jobs
+        self.options = options
+        self.options.pop('packed', None)
+        self.cache = CodebookCache(quantization=options.get('quantize', 0))
+        self.buffer = b''
+        self.offset = 0
+        self.pending = []
+        self.pendingBytes = 0
+
+    def readable(self):
+        """ Whether the file is opened for reading. """
+        return self.mode == 'rb'
+
+    def writable(self):
+        """ Whether the file is opened for writing. """
+        return self.mode != 'rb'
+
+    def seekable(self):
+        """ Whether the file supports seeking, which it does not. """
+        return False
+
+    def checkMode(self, reading):
+        """ Ensure that the file is open and in a mode that allows reading
+            or writing. """
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if reading != self.readable():
+            raise io.UnsupportedOperation(
+                'not readable' if reading else 'not writable')
+
+    def readMember(self):
+        """ Decompress the next member into the buffer. Returns False if no
+            members are left. """
+        container = Container.readNext(self.fileobj, self.jobs, self.cache)
+        if container is None:
+            return False
+        self.buffer = self.buffer[self.offset:] + \
+            decompressContainer(container, self.fileobj)
+        self.offset = 0
+        return True
+
+    def bytesBuffered(self):
+        """ Get the number of decompressed bytes not yet read. """
+        return len(self.buffer) - self.offset
+
+    def consume(self, size):
+        """ Take up to a number of bytes, or all bytes if it is negative,
+            from the buffer. """
+        if size is None or size < 0:
+            size = self.bytesBuffered()
+        contents = self.buffer[self.offset:self.offset + size]
+        self.offset += len(contents)
+        return contents
+
+    def read(self, size=-1):
+        """ Read up to a number of bytes, or all bytes if it is negative. """
+        self.checkMode(True)
+        while (size is None or size < 0 or self.bytesBuffered() < size) \
+                and self.readMember():
+            pass
+        return self.consume(size)
+
+    def read1(self, size=-1):
+        """ Read up to a number of bytes, decompressing at most one
+            member. """
+        self.checkMode(True)
+        if self.bytesBuffered() == 0:
+            self.readMember()
+        return self.consume(size)
+
+    def write(self, data):
+        """ Write bytes. Returns the number of bytes written. """
+        self.checkMode(False)
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        self.pending.append(bytes(data))
+        self.pendingBytes += len(data)
+        if self.pendingBytes >= self.memberSize:
+            contents = b''.join(self.pending)
+            complete = len(contents) - len(contents) % self.memberSize
+            for i in range(0, complete, self.memberSize):
+                self.writeMember(contents[i:i + self.memberSize])
+            self.pending = [contents[complete:]]
+            self.pendingBytes = len(contents) - complete
+        return len(data)
+
+    def writeMember(self, contents):
+        """ Compress bytes to a member and write it. """
+        self.fileobj.write(compress(contents, jobs=self.jobs,
+                                    cache=self.cache, **self.options))
+
+    def flush(self):
+        """ Flush the underlying file object. Bytes that do not yet fill a
+            member remain pending until the file is closed. """
+        self.checkMode(self.readable())
+        if self.writable():
+            self.fileobj.flush()
+
+    def close(self):
+        """ Compress any pending bytes and close the file. """
+        if self.closed:
+            return
+        try:
+            if self.writable() and self.pendingBytes > 0:
+                self.writeMember(b''.join(self.pending))
+                self.fileobj.flush()
+        finally:
+            self.pending = []
+            self.pendingBytes = 0
+            try:
+                io.BufferedIOBase.close(self)
+            finally:
+                if self.ownsFileobj:
+                    self.fileobj.close()
@@ -0,0 +1,187 @@
+import struct
+from arhc import ARHC
+from block import Blocks
+from cache import CodebookCache
+from golomb import Golomb
+from probability import ConstantProbability, AdaptiveProbability
+from stream import packBits, readExactly, unpackBits
+
+
+class Header:
+
+    """
+    Description of compressed contents: everything needed to decompress them
+    besides the compressed bits themselves.
+
+    :param N:         Number of bits of the decompressed contents.
+    :param adaptive:  Use the adaptive probability model.
+    :param prob1:     Probability of one of the static model.
+    :param alpha0:    Pseudo-count of zero of the adaptive model.
+    :param alpha1:    Pseudo-count of one of the adaptive model.
+    :param engine:    Name of the compressor, one of engines.
+    :param quantize:  Number of grid points the probability of one is
+                      quantized onto, or zero for no quantization.
+    :param packed:    Whether the decompressed contents are packed bytes.
+    :param blockSize: Number of bits per block, or zero for a single block.
+    """
+
+    engines = ['huffman', 'golomb', 'vectorized', 'canonical']
+    layout = '>B?B?dddIQQ'
+
+    def __init__(self, N, adaptive=False, prob1=0.01, alpha0=0.5, alpha1=0.5,
+                 engine='huffman', quantize=0, packed=False, blockSize=0):
+        self.N = N
+        self.adaptive = adaptive
+        self.prob1 = prob1
+        self.alpha0 = alpha0
+        self.alpha1 = alpha1
+        self.engine = engine
+        self.quantize = quantize
+        self.packed = packed
+        self.blockSize = blockSize
+
+    def createModel(self):
+        """ Create the probability model. """
+        if self.adaptive:
+            return AdaptiveProbability(self.alpha0, self.alpha1)
+        return ConstantProbability(self.prob1)
+
+    def createEngine(self, cache=None):
+        """ Create the compressor. A given cache of symbol codes is used only
+            if it quantizes as the contents were compressed. """
+        if cache is None or (cache.quantization or 0) != self.quantize:
+            cache = CodebookCache(cache.size if cache else 1024, self.quantize)
+        if self.engine == 'golomb':
+            return Golomb(self.createModel())
+        if self.engine == 'vectorized':
+            # NumPy is only required for vectorized compression
+            try:
+                from vectorized import VectorizedARHC
+            except ImportError:
+                raise ValueError('vectorized compression requires NumPy')
+            return VectorizedARHC(self.createModel(), cache)
+        return ARHC(self.createModel(), cache, self.engine == 'canonical')
+
+    def getBlockSize(self):
+        """ Get the number of bits per block. """
+        return self.blockSize if self.blockSize > 0 else max(1, self.N)
+
+    def pack(self):
+        """ Pack the header into bytes. """
+        return struct.pack(self.layout, Container.version, self.adaptive,
+                           self.engines.index(self.engine), self.packed,
+                           self.prob1, self.alpha0, self.alpha1,
+                           self.quantize, self.N, self.blockSize)
+
+    @classmethod
+    def unpack(cls, contents):
+        """ Unpack a header from bytes. """
+        version, adaptive, engine, packed, prob1, alpha0, alpha1, quantize, \
+            N, blockSize = struct.unpack(cls.layout, contents)
+        if version != Container.version:
+            raise ValueError('unsupported version {}'.format(version))
+        return cls(N, adaptive, prob1, alpha0, alpha1, cls.engines[engine],
+                   quantize, packed, blockSize)
+
+
+class Container:
+
+    """
+    Self-describing format of compressed contents. Starts with a magic
+    number and a header, followed by an index of the number of bytes of
+    every compressed block and the blocks themselves, each padded with zeros
+    to whole bytes. The index allows any range of bits to be decompressed
+    from only the blocks that cover it.
+
+    :param header: Header that describes the contents.
+    :param jobs:   Number of processes that compress or decompress blocks.
+    :param cache:  Cache of symbol codes shared by the blocks.
+    """
+
+    magic = b'ARHC'
+    version = 1
+    indexFormat = '>Q'
+
+    def __init__(self, header, jobs=1, cache=None):
+        self.header = header
+        self.blocks = Blocks(header.createEngine(cache),
+                             header.getBlockSize(), jobs)
+        self.lengths = []
+
+    def compress(self, inStream, channel):
+        """ Compress the contents of a stream and write the container to a
+            channel of bytes. """
+        codes = [packBits(code + '0' * (-len(code) % 8))
+                 for code in self.blocks.compressBlocks(inStream)]
+        channel.write(self.magic + self.header.pack())
+        channel.write(b''.join(struct.pack(self.indexFormat, len(code))
+                              for code in codes))
+        for code in codes:
+            channel.write(code)
+        channel.flush()
+
+    @classmethod
+    def read(cls, channel, jobs=1, cache=None):
+        """ Read the magic number, header and index of a container from a
+            channel of bytes. """
+        container = cls.readNext(channel, jobs, cache)
+        if container is None:
+            raise ValueError('not an ARHC container')
+        return container
+
+    @classmethod
+    def readNext(cls, channel, jobs=1, cache=None):
+        """ Read the magic number, header and index of the next of a sequence
+            of containers from a channel of bytes. Returns None if the
+            channel is exhausted. """
+        magic = channel.read(len(cls.magic))
+        if not magic:
+            return None
+        if len(magic) < len(cls.magic):
+            magic += readExactly(channel, len(cls.magic) - len(magic),
+                                 name='ARHC container')
+        if magic != cls.magic:
+            raise ValueError('not an ARHC container')
+        header = Header.unpack(
+            readExactly(channel, struct.calcsize(Header.layout),
+                        name='ARHC container'))
+        container = cls(header, jobs, cache)
+        size = struct.calcsize(cls.indexFormat)
+        container.lengths = [
+            struct.unpack(cls.indexFormat,
+                          readExactly(channel, size, name='ARHC container'))[0]
+            for _ in container.blocks.getBlockSizes(header.N)]
+        return container
+
+    def decompress(self, channel, outStream, start=0, end=None):
+        """ Decompress the range of bits [start, end) from a channel of bytes
+            positioned after the index, and write it to a stream. Only the
+            blocks that cover the range are read and decompressed. A range
+            that extends past the end of the contents is cut off there. """
+        if start < 0 or (end is not None and (end < 0 or end < start)):
+            raise ValueError('invalid range [{}, {})'.format(start, end))
+        end = self.header.N if end is None else min(end, self.header.N)
+        start = min(start, end)
+        blockSize = self.blocks.blockSize
+        sizes = self.blocks.getBlockSizes(self.header.N)
+        first = start // blockSize
+        last = (end - 1) // blockSize + 1 if end > start else first
+        skip(channel, sum(self.lengths[:first]))
+        codes = [unpackBits(readExactly(channel, length,
+                                        name='ARHC container'))
+                 for length in self.lengths[first:last]]
+        offset = first * blockSize
+        for block in self.blocks.decompressBlocks(codes, sizes[first:last]):
+            outStream.write(block[max(0, start - offset):end - offset])
+            offset += len(block)
+        outStream.finish()
+
+
+def skip(channel, size):
+    """ Skip a number of bytes of a channel, seeking if possible. """
+    try:
+        channel.seek(size, 1)
+    except (AttributeError, IOError, OSError, ValueError):
+        while size > 0:
+            size -= len(readExactly(channel, min(size, 1 << 16),
+                                    name='ARHC container'))
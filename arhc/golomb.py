@@ -0,0 +1,75 @@
+import math
+import sys
+from stream import binary, readBinary
+
+
+class Golomb:
+
+    """
+    Golomb code of the runs of zeros in a stream, which is the static
+    counterpart of the Adaptive Run-length Huffman Compressor that builds no
+    trees or tables. A run of zeros, terminated by a one or by the end of the
+    stream, is encoded by the quotient of its length and the Golomb parameter
+    in unary, as zeros terminated by a one, followed by the remainder in
+    truncated binary.
+
+    :param prob1: Probability of one, which must be constant.
+    """
+
+    def __init__(self, prob1):
+        self.prob1 = prob1
+        self.parameter = self.calculateParameter()
+        self.bits = (self.parameter - 1).bit_length()
+        self.cutoff = (1 << self.bits) - self.parameter
+
+    def calculateParameter(self):
+        """ Calculate the Golomb parameter, which is the optimal run-length of
+            the ARHC. """
+        return max(1, int(round(math.log(0.5) /
+                         math.log(1 - self.prob1.getPredictive1()))))
+
+    def encodeRun(self, run):
+        """ Get the code symbol of a run of zeros. """
+        quotient, remainder = divmod(run, self.parameter)
+        if remainder < self.cutoff:
+            code = binary(remainder, self.bits - 1)
+        else:
+            code = binary(remainder + self.cutoff, self.bits)
+        return '0' * quotient + '1' + code
+
+    def decodeRun(self, stream):
+        """ Decode the length of the first run of zeros encountered in a
+            stream. """
+        quotient = stream.readRun(sys.maxsize)
+        remainder = 0
+        if self.bits > 0:
+            remainder = readBinary(stream, self.bits - 1)
+            if remainder >= self.cutoff:
+                remainder = 2 * remainder + readBinary(stream, 1) - \
+                    self.cutoff
+        return quotient * self.parameter + remainder
+
+    def compress(self, inStream, outStream):
+        """ Compress the contents of a stream and write the compressed
+            contents to another stream. Raises a ValueError if the stream
+            ends before its number of bits is read. """
+        while inStream.bitsLeftToRead() > 0:
+            bitsRead = inStream.bitsRead
+            run = inStream.readRun(inStream.bitsLeftToRead())
+            if inStream.bitsRead == bitsRead:
+                raise ValueError('input shorter than N = {} bits'.format(
+                    inStream.N))
+            outStream.write(self.encodeRun(run))
+        outStream.finish()
+
+    def decompress(self, inStream, outStream):
+        """ Decompress the contents of a stream and write the decompressed
+            contents to another stream. """
+        while outStream.bitsLeftToWrite() > 0:
+            run = self.decodeRun(inStream)
+            bitsLeft = outStream.bitsLeftToWrite()
+            if run < bitsLeft:
+                outStream.write('0' * run + '1')
+            else:
+                outStream.write('0' * bitsLeft)
+        outStream.finish()
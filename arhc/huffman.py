@@ -1,38 +1,183 @@
+import heapq
 from node import Node
-import sys
 
 class Huffman:
 
     """
     Construct a symbol code via the Huffman algorithm.
 
-    :param symbols: List of symbols that represents the alphabet.
+    Equally probable symbols are merged in a fixed order: merged pairs before
+    symbols of the alphabet, more recently merged pairs first, and symbols of
+    the alphabet in the order in which they are given. The resulting tree is
+    therefore independent of the method used to construct it.
+
+    The code symbols are available both by symbol, in encoding, and by the
+    position of the symbol in the alphabet, in codes.
+
+    The order in which symbols are merged is recorded in merges, as pairs of
+    keys: the position in the alphabet for symbols of the alphabet and minus
+    the number of the merge for merged pairs. If the Huffman algorithm merges
+    the symbols of other probabilities in the same order, it builds the same
+    tree, which matches checks without building anything.
+
+    A symbol code can also be constructed from given code symbols with
+    fromEncoding, in which case no tree is built and decoding uses lookup
+    tables from the start.
+
+    :param symbols: List of symbols that represents the alphabet, or None
+                    for an empty symbol code.
     """
 
-    def __init__(self, symbols):
-        self.build(symbols)
+    tableBits = 8
+
+    def __init__(self, symbols=None):
+        self.root = None
+        self.encoding = {}
+        self.codes = []
+        self.merges = None
+        if symbols is not None:
+            self.build(symbols)
+        self.table = None
+        self.decodes = 0
+
+    @classmethod
+    def fromEncoding(cls, symbols, codes):
+        """ Construct a symbol code from the code symbols of symbols, both
+            given in the order of the alphabet. """
+        huffman = cls()
+        huffman.encoding = dict(zip(symbols, codes))
+        huffman.codes = list(codes)
+        return huffman
 
     def build(self, symbols):
-        """ Build a tree of symbols according to the Huffman algorithm. """
-        while len(symbols) > 1:
-            self.mergeTwoLowestProbSymbols(symbols)
-        self.root = symbols[0]
+        """ Build a tree of symbols according to the Huffman algorithm. Uses
+            a linear-time construction if the symbols are sorted by
+            probability and a heap otherwise. """
+        probs = [symbol.getProb() for symbol in symbols]
+        self.merges = []
+        self.keys = dict((id(symbol), i) for i, symbol in enumerate(symbols))
+        if all(a <= b for a, b in zip(probs, probs[1:])):
+            self.root = self.buildSorted(symbols)
+        elif all(a > b for a, b in zip(probs, probs[1:])):
+            self.root = self.buildSorted(symbols[::-1])
+        else:
+            self.root = self.buildHeap(symbols)
+        del self.keys
         self.encoding = dict(self.root.getEncoding())
+        self.codes = [self.encoding[symbol.symbol] for symbol in symbols]
+
+    def buildHeap(self, symbols):
+        """ Build a tree by repeatedly merging the two lowest probability
+            symbols taken from a heap. """
+        heap = [(symbol.getProb(), i, symbol)
+                for i, symbol in enumerate(symbols)]
+        heapq.heapify(heap)
+        for merged in range(1, len(symbols)):
+            left = heapq.heappop(heap)[2]
+            right = heapq.heappop(heap)[2]
+            node = self.merge(left, right)
+            heapq.heappush(heap, (node.getProb(), -merged, node))
+        return heap[0][2]
+
+    def buildSorted(self, symbols):
+        """ Build a tree from symbols sorted by ascending probability by
+            keeping the merged pairs, which are created in order of ascending
+            probability, in a second queue. """
+        nodes = []
+        i = j = 0
+        for _ in range(1, len(symbols)):
+            pair = []
+            while len(pair) < 2:
+                if j < len(nodes) and (i == len(symbols) or
+                                       nodes[j].prob <= symbols[i].getProb()):
+                    # Take the most recently merged of equally probable pairs
+                    k = j
+                    while k + 1 < len(nodes) and \
+                            nodes[k + 1].prob == nodes[j].prob:
+                        k += 1
+                    if k == j:
+                        j += 1
+                        pair.append(nodes[k])
+                    else:
+                        pair.append(nodes.pop(k))
+                else:
+                    pair.append(symbols[i])
+                    i += 1
+            nodes.append(self.merge(*pair))
+        return nodes[-1] if nodes else symbols[0]
+
+    def merge(self, left, right):
+        """ Merge a pair of nodes and record the merge. """
+        node = Node(left, right)
+        self.merges.append((self.keys[id(left)], self.keys[id(right)]))
+        self.keys[id(node)] = -len(self.merges)
+        return node
 
-    def mergeTwoLowestProbSymbols(self, symbols):
-        """ Merge the two lowest probability symbols. """
-        symbols.sort(key=lambda symbol: symbol.getProb())
-        symbols.insert(0, Node(symbols.pop(0), symbols.pop(0)))
+    def matches(self, probs):
+        """ Check whether the Huffman algorithm merges symbols of given
+            probabilities, in the order of the alphabet, in the recorded
+            order, and thus builds the same tree. This is the case if the
+            parts of the merges are taken in order of probability, equally
+            probable ones in the fixed order, and every merged pair is more
+            probable than its parts. """
+        if self.merges is None or len(probs) != len(self.merges) + 1:
+            return False
+        merged = []
+        lastProb, lastKey = float('-inf'), 0
+        for left, right in self.merges:
+            leftProb = probs[left] if left >= 0 else merged[-left - 1]
+            rightProb = probs[right] if right >= 0 else merged[-right - 1]
+            if leftProb < lastProb or rightProb < leftProb or \
+                    (leftProb == lastProb and left < lastKey) or \
+                    (rightProb == leftProb and right < left):
+                return False
+            prob = leftProb + rightProb
+            if prob <= rightProb:
+                return False
+            merged.append(prob)
+            lastProb, lastKey = rightProb, right
+        return True
 
-    def encode(self, stream):
-        """ Encode the first symbol encountered in a stream by the code symbol
-            generated by the Huffman algorithm. """
-        symbol = ''
-        while not (symbol in self.encoding):
-            symbol += stream.read()
-        return self.encoding[symbol]
+    def buildTable(self, codes):
+        """ Build a lookup table from pairs of symbols and code symbols that
+            decodes up to tableBits bits at once. Code symbols that are
+            longer refer to further tables for their remaining bits. """
+        width = min(self.tableBits, max(len(code) for _, code in codes))
+        entries = [None] * (1 << width)
+        longer = {}
+        for symbol, code in codes:
+            if len(code) <= width:
+                span = 1 << (width - len(code))
+                start = int(code, 2) * span
+                entry = (len(code), symbol, None)
+                entries[start:start + span] = [entry] * span
+            else:
+                longer.setdefault(code[:width], []).append(
+                    (symbol, code[width:]))
+        for prefix, remainders in longer.items():
+            entries[int(prefix, 2)] = (width, None,
+                                       self.buildTable(remainders))
+        return width, entries
 
     def decode(self, stream):
-        """ Decode the first code symbol encountered in a stream by its symbol
-            in string representation. """
-        return self.root.decode(stream)
+        """ Decode the first code symbol encountered in a stream by the name of
+            its symbol. Looks up several bits at once, waiting
+            for further bits only if the code symbol needs them. The lookup
+            tables are only built once the code is used a second time. """
+        self.decodes += 1
+        if self.decodes == 1 and self.root is not None:
+            return self.root.decode(stream)
+        if self.table is None:
+            self.table = self.buildTable(list(self.encoding.items()))
+        table = self.table
+        while table is not None:
+            width, entries = table
+            bits = stream.peek(width)
+            length, symbol, nextTable = entries[int(bits.ljust(width, '0'), 2)]
+            while length > len(bits) and stream.fill(len(bits) + 1):
+                bits = stream.peek(width)
+                length, symbol, nextTable = entries[
+                    int(bits.ljust(width, '0'), 2)]
+            stream.read(length)
+            table = nextTable
+        return symbol
@@ -4,7 +4,7 @@ class Leaf:
     Encapsulation of a symbol in a symbol code. When used in conjunction with
     Node it acts as the leaf of a binary tree.
 
-    :param symbol: String representation of the symbol.
+    :param symbol: Name of the symbol.
     :param prob:   Probability of the symbol.
     """
 
@@ -23,6 +23,6 @@ class Leaf:
         return [(self.symbol, encoding)]
 
     def decode(self, stream):
-        """ Return the string that represents the symbol. Acts as the base
+        """ Return the name of the symbol. Acts as the base
             case in decoding the tree. """
         return self.symbol
@@ -0,0 +1,96 @@
+import mmap
+import os
+
+
+class MappedInput:
+
+    """
+    Input channel that reads a file through a read-only memory map, such
+    that reading does not call into the file system and chunks are taken
+    from the map without copying where memoryview supports it.
+
+    :param path: Path of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # Empty files cannot be mapped
+            self.contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if self.size > 0 else b''
+        try:
+            self.view = memoryview(self.contents)
+        except TypeError:
+            self.view = self.contents
+
+    def read1(self, size):
+        """ Read up to a number of bytes. """
+        chunk = self.view[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def read(self, size):
+        """ Read up to a number of bytes. """
+        return self.read1(size)
+
+    def countBits(self, packed):
+        """ Count the bits in the file: all bits of its bytes if packed, and
+            the characters '0' and '1' otherwise. """
+        if packed:
+            return 8 * self.size
+        count = 0
+        for start in range(0, self.size, 1 << 24):
+            chunk = self.contents[start:start + (1 << 24)]
+            count += chunk.count(b'0') + chunk.count(b'1')
+        return count
+
+    def close(self):
+        """ Unmap the file. """
+        if hasattr(self.view, 'release'):
+            self.view.release()
+        if self.size > 0:
+            self.contents.close()
+
+
+class MappedOutput:
+
+    """
+    Output channel that writes a file through a writable memory map. The
+    file is preallocated to a given size, which should be the final size if
+    it is known or a bound on it otherwise; the map grows by doubling if
+    more is written, and the file is truncated to what was written when it
+    is closed.
+
+    :param path: Path of the file.
+    :param size: Number of bytes to preallocate.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.position = 0
+        self.file = open(path, 'w+b')
+        # Empty files cannot be mapped
+        self.file.truncate(max(size, 1))
+        self.contents = mmap.mmap(self.file.fileno(), max(size, 1))
+
+    def write(self, contents):
+        """ Write bytes or ASCII characters. """
+        if not isinstance(contents, bytes):
+            contents = contents.encode('ascii')
+        end = self.position + len(contents)
+        if end > len(self.contents):
+            self.contents.resize(max(end, 2 * len(self.contents)))
+        self.contents[self.position:end] = contents
+        self.position = end
+
+    def flush(self):
+        """ Do nothing, since the map is written back when it is closed. """
+        pass
+
+    def close(self):
+        """ Unmap the file and truncate it to what was written. """
+        self.contents.close()
+        self.file.truncate(self.position)
+        self.file.close()
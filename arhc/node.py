@@ -14,10 +14,11 @@ class Node:
     def __init__(self, left, right):
         self.left = left
         self.right = right
+        self.prob = left.getProb() + right.getProb()
 
     def getProb(self):
         """ Get probability of the combined pair of symbols. """
-        return self.left.getProb() + self.right.getProb()
+        return self.prob
 
     def getEncoding(self, prefix=''):
         """ Get encoding of all symbols contained in the subtree below this
@@ -6,6 +6,8 @@ class ConstantProbability:
     :param prob1: Probability of one.
     """
 
+    bitLevel = False
+
     def __init__(self, prob1):
         self.prob1 = prob1
 
@@ -13,6 +15,10 @@ class ConstantProbability:
         """ Do nothing since the probability of one is fixed. """
         pass
 
+    def observeCounts(self, zeros, ones):
+        """ Do nothing since the probability of one is fixed. """
+        pass
+
     def getPredictive1(self):
         """ Get predictive probability of one. """
         return self.prob1
@@ -25,19 +31,30 @@ class AdaptiveProbability:
     p ~ Beta(alpha0, alpha1) as the prior distribution. Updates via Ber(p)
     likelihood.
 
+    The belief depends only on the numbers of zeros and ones observed, so
+    it need not observe every bit separately: bitLevel is False, and
+    compressors update it once per symbol with observeCounts.
+
     :param alpha0: Pseudo-count associated with the probability of zero.
     :param alpha1: Pseudo-count associated with the probability of one.
     """
 
+    bitLevel = False
+
     def __init__(self, alpha0, alpha1):
         self.alpha0 = float(alpha0)
         self.alpha1 = float(alpha1)
 
     def observe(self, string):
         """ Update belief according to an observation. """
-        observed1 = sum(map(int, string))
-        self.alpha0 += len(string) - observed1
-        self.alpha1 += observed1
+        observed1 = string.count('1')
+        self.observeCounts(len(string) - observed1, observed1)
+
+    def observeCounts(self, zeros, ones):
+        """ Update belief according to a number of observed zeros and
+            ones. """
+        self.alpha0 += zeros
+        self.alpha1 += ones
 
     def getPredictive1(self):
         """ Find the predictive probability of one. """
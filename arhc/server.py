@@ -0,0 +1,80 @@
+import json
+import os
+import socket
+import struct
+from stream import readExactly
+
+
+class Server:
+
+    """
+    Serving of requests over a channel of bytes by a long-lived process.
+    Requests and responses are frames that consist of the lengths of a
+    header and of a payload, as two 32-bit unsigned integers, followed by
+    the header, which is a JSON object, and the payload.
+
+    :param handler: Function that takes the header and the payload of a
+                    request and returns those of its response.
+    """
+
+    frameFormat = '>II'
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = 0
+
+    def serve(self, inChannel, outChannel):
+        """ Answer the requests read from a channel of bytes until it is
+            exhausted. """
+        while True:
+            request = readFrame(inChannel)
+            if request is None:
+                return
+            self.requests += 1
+            writeFrame(outChannel, *self.handler(*request))
+
+    def serveUnix(self, path):
+        """ Listen on a Unix socket and answer the requests of every
+            connection in turn. """
+        if os.path.exists(path):
+            os.remove(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        try:
+            while True:
+                connection = listener.accept()[0]
+                inChannel = connection.makefile('rb')
+                outChannel = connection.makefile('wb')
+                try:
+                    self.serve(inChannel, outChannel)
+                except (IOError, OSError, ValueError):
+                    pass  # A broken connection only ends itself
+                finally:
+                    inChannel.close()
+                    outChannel.close()
+                    connection.close()
+        finally:
+            listener.close()
+            os.remove(path)
+
+
+def readFrame(channel):
+    """ Read a frame from a channel of bytes. Returns the header and the
+        payload, or None if the channel is exhausted. """
+    lengths = readExactly(channel, struct.calcsize(Server.frameFormat),
+                          allowEOF=True, name='frame')
+    if lengths is None:
+        return None
+    headerLength, payloadLength = struct.unpack(Server.frameFormat, lengths)
+    header = readExactly(channel, headerLength, name='frame')
+    payload = readExactly(channel, payloadLength, name='frame')
+    return json.loads(header.decode('utf-8')), payload
+
+
+def writeFrame(channel, header, payload=b''):
+    """ Write a frame to a channel of bytes. """
+    header = json.dumps(header).encode('utf-8')
+    channel.write(struct.pack(Server.frameFormat, len(header), len(payload)) +
+                  header + payload)
+    channel.flush()
@@ -0,0 +1,355 @@
+import itertools
+import socket
+import threading
+from collections import deque
+from timeit import default_timer
+from cache import CodebookCache
+from container import Header
+from server import readFrame, writeFrame
+from stream import Stream
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+
+class SessionError(Exception):
+    """ Error that ends a session. """
+
+
+class SocketChannel:
+
+    """
+    Communication channel over a socket that returns whatever bytes are
+    available when read, as Stream expects, and that honours the timeout of
+    the socket.
+
+    :param connection: Connected socket.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def read1(self, size):
+        """ Receive up to a number of bytes, waiting only until any are
+            available. """
+        return self.connection.recv(size)
+
+    def read(self, size):
+        """ Receive up to a number of bytes. """
+        return self.connection.recv(size)
+
+    def write(self, contents):
+        """ Send bytes or ASCII characters. """
+        if not isinstance(contents, bytes):
+            contents = contents.encode('ascii')
+        self.connection.sendall(contents)
+
+    def flush(self):
+        """ Do nothing since sent bytes are not buffered. """
+        pass
+
+
+class Session:
+
+    """
+    Compression or decompression of the bit channel of one connection in
+    streaming mode, with its own probability model, ARHC and cache of
+    symbol codes. Keeps track of the bits that pass and of the latency of
+    every symbol, which is the time from reading its last bit to writing
+    its code, or vice versa.
+
+    The session is ended if it holds more than memoryCap bits: the bits
+    read but not yet consumed, the bits written but not yet flushed and the
+    current run-length, which is the size of the alphabet. A handshake
+    whose initial run-length alone exceeds memoryCap is refused.
+
+    :param number:     Number of the session.
+    :param parameters: Parameters of the handshake.
+    :param memoryCap:  Maximum number of bits held by the session.
+    :param cacheSize:  Number of symbol codes kept by the session.
+    """
+
+    samples = 1000
+
+    def __init__(self, number, parameters, memoryCap, cacheSize):
+        self.number = number
+        self.mode = parameters.get('mode', 'compress')
+        if self.mode not in ['compress', 'decompress']:
+            raise SessionError('unknown mode "{}"'.format(self.mode))
+        self.packed = bool(parameters.get('packed', False))
+        self.flush = parameters.get('flush', 'interactive')
+        if self.flush not in Stream.policies:
+            raise SessionError('unknown flush policy "{}"'.format(self.flush))
+        self.flushInterval = parameters.get('flushMs', 100)
+        quantize = int(parameters.get('quantize', 0))
+        prob1 = float(parameters.get('prob1', 0.01))
+        if not 0 < prob1 < 1:
+            raise SessionError('probability of one {} not between 0 and 1'
+                               .format(prob1))
+        alpha0 = float(parameters.get('alpha0', 0.5))
+        alpha1 = float(parameters.get('alpha1', 0.5))
+        if not (alpha0 > 0 and alpha1 > 0):
+            raise SessionError('pseudo-counts {} and {} not positive'
+                               .format(alpha0, alpha1))
+        header = Header(None, bool(parameters.get('adaptive', False)), prob1,
+                        alpha0, alpha1, quantize=quantize, packed=self.packed)
+        self.arhc = header.createEngine(CodebookCache(cacheSize, quantize))
+        # The alphabet is built before the bits held can be checked
+        runLength = self.arhc.calculateOptimalRunLength()
+        if runLength > memoryCap:
+            raise SessionError('run-length {} more than {} bits'
+                               .format(runLength, memoryCap))
+        self.memoryCap = memoryCap
+        self.state = 'active'
+        self.bitsIn = 0
+        self.bitsOut = 0
+        self.started = default_timer()
+        self.ended = None
+        self.lastRead = self.started
+        self.latencies = deque(maxlen=self.samples)
+
+    def run(self, channel):
+        """ Compress or decompress the bits read from a channel and write
+            the result to the channel. """
+        self.inStream = Stream(channel, None, self.packed)
+        self.outStream = Stream(channel, None, self.packed, self.flush,
+                                self.flushInterval)
+        self.outStream.bufferBits = min(self.outStream.bufferBits,
+                                        self.memoryCap)
+        # A chunk of packed bytes holds eight bits per byte
+        self.inStream.chunkSize = max(1, min(self.inStream.chunkSize,
+                                             self.memoryCap // 8))
+        self.inStream.observeRead(self.observeRead)
+        self.outStream.observeWrite(self.observeWrite)
+        if self.mode == 'compress':
+            self.arhc.compressStreaming(self.inStream, self.outStream)
+        else:
+            self.arhc.decompressStreaming(self.inStream, self.outStream)
+
+    def observeRead(self, bits):
+        """ Account for bits that are read. """
+        self.bitsIn += len(bits)
+        self.lastRead = default_timer()
+
+    def observeWrite(self, bits):
+        """ Account for bits that are written, and end the session if it
+            holds too many bits. """
+        self.bitsOut += len(bits)
+        self.latencies.append(default_timer() - self.lastRead)
+        held = self.inStream.bitsBuffered() + self.outStream.pendingBits + \
+            self.arhc.runLength
+        if held > self.memoryCap:
+            raise SessionError('session holds {} bits, more than {}'
+                               .format(held, self.memoryCap))
+
+    def end(self, state='done'):
+        """ Mark the session as ended. """
+        self.state = state
+        self.ended = default_timer()
+
+    def getMetrics(self):
+        """ Get the throughput and latency of the session. """
+        seconds = (self.ended or default_timer()) - self.started
+        latencies = sorted(self.latencies) or [0.0]
+        last = len(latencies) - 1
+        return {
+            'session': self.number,
+            'mode': self.mode,
+            'state': self.state,
+            'bitsIn': self.bitsIn,
+            'bitsOut': self.bitsOut,
+            'seconds': seconds,
+            'bitsPerSecond': self.bitsIn / seconds if seconds > 0 else 0.0,
+            'latencyUs': dict((str(point),
+                               1e6 * latencies[last * point // 100])
+                              for point in [50, 90, 99])
+        }
+
+
+class SessionHandler(socketserver.BaseRequestHandler):
+
+    """
+    Handler of a connection to the CompressionService. The connection
+    starts with a frame from the client whose header holds the parameters
+    of the session, to which the service answers with a frame that accepts
+    or refuses the session. The client then sends its bits and shuts down
+    its side of the connection at the end, and the service sends the
+    compressed or decompressed bits and closes the connection.
+
+    A handshake with the mode 'metrics' is instead answered with a frame
+    that holds the metrics of all sessions.
+    """
+
+    def handle(self):
+        service = self.server
+        self.request.settimeout(service.sessionTimeout)
+        # Codes are sent as soon as they are flushed
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        channel = SocketChannel(self.request)
+        try:
+            request = readFrame(channel)
+        except (socket.error, ValueError):
+            return
+        if request is None:
+            return
+        parameters = request[0]
+        if parameters.get('mode') == 'metrics':
+            writeFrame(channel, {'status': 0,
+                                 'sessions': service.getMetrics()})
+            return
+        try:
+            session = service.openSession(parameters)
+        except (SessionError, TypeError, ValueError) as e:
+            writeFrame(channel, {'status': 1, 'error': str(e)})
+            return
+        writeFrame(channel, {'status': 0, 'session': session.number})
+        try:
+            session.run(channel)
+            session.end()
+        except socket.timeout:
+            session.end('timed out')
+        except (SessionError, socket.error, ValueError) as e:
+            session.end('error: {}'.format(e))
+        finally:
+            service.closeSession(session)
+            try:
+                self.request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class CompressionService(socketserver.ThreadingMixIn,
+                         socketserver.TCPServer):
+
+    """
+    Network service in which many clients each compress or decompress their
+    own bit channel in streaming mode, every session in its own thread.
+
+    Reading waits for bits and writing waits for the client to receive, so
+    a session consumes its input only as fast as its output is taken:
+    backpressure is that of the connection itself.
+
+    :param address:        Address to listen on, as a pair of a host and a
+                           port.
+    :param maxSessions:    Maximum number of concurrent sessions.
+    :param sessionTimeout: Number of seconds after which an idle session
+                           ends.
+    :param memoryCap:      Maximum number of bits held by a session.
+    :param cacheSize:      Number of symbol codes kept by a session.
+    :param history:        Number of ended sessions whose metrics are kept.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, maxSessions=64, sessionTimeout=60.0,
+                 memoryCap=1 << 20, cacheSize=64, history=100):
+        socketserver.TCPServer.__init__(self, address, SessionHandler)
+        self.maxSessions = maxSessions
+        self.sessionTimeout = sessionTimeout
+        self.memoryCap = memoryCap
+        self.cacheSize = cacheSize
+        self.lock = threading.Lock()
+        self.numbers = itertools.count(1)
+        self.sessions = {}
+        self.ended = deque(maxlen=history)
+
+    def openSession(self, parameters):
+        """ Start a session, unless too many are active. """
+        with self.lock:
+            if len(self.sessions) >= self.maxSessions:
+                raise SessionError('too many sessions')
+            session = Session(next(self.numbers), parameters, self.memoryCap,
+                              self.cacheSize)
+            self.sessions[session.number] = session
+            return session
+
+    def closeSession(self, session):
+        """ Keep the metrics of an ended session. """
+        with self.lock:
+            del self.sessions[session.number]
+            self.ended.append(session)
+
+    def getMetrics(self):
+        """ Get the metrics of all active and recently ended sessions. """
+        with self.lock:
+            sessions = list(self.ended) + list(self.sessions.values())
+        return [session.getMetrics() for session in sessions]
+
+
+class Client:
+
+    """
+    Client of the CompressionService.
+
+    :param address: Address of the service, as a pair of a host and a port.
+    :param timeout: Number of seconds after which waiting for the service
+                    fails.
+    """
+
+    chunkSize = 1 << 12
+
+    def __init__(self, address, timeout=60.0):
+        self.address = address
+        self.timeout = timeout
+
+    def connect(self, parameters):
+        """ Open a connection and perform the handshake. """
+        connection = socket.create_connection(self.address, self.timeout)
+        channel = SocketChannel(connection)
+        writeFrame(channel, parameters)
+        response = readFrame(channel)
+        if response is None or response[0]['status'] != 0:
+            connection.close()
+            raise SessionError(response[0]['error'] if response else
+                               'connection closed')
+        return connection, response[0]
+
+    def run(self, chunks, mode='compress', **parameters):
+        """ Send chunks of bits, bytes if packed and '0' and '1' otherwise,
+            in a session and return everything the service sends back. The
+            chunks are sent while the result is received. """
+        parameters['mode'] = mode
+        connection, _ = self.connect(parameters)
+        errors = []
+
+        def send():
+            try:
+                for chunk in chunks:
+                    SocketChannel(connection).write(chunk)
+                connection.shutdown(socket.SHUT_WR)
+            except socket.error as e:
+                errors.append(e)
+
+        sender = threading.Thread(target=send)
+        sender.daemon = True
+        sender.start()
+        received = []
+        try:
+            while True:
+                chunk = connection.recv(self.chunkSize)
+                if not chunk:
+                    break
+                received.append(chunk)
+        finally:
+            sender.join()
+            connection.close()
+        if errors:
+            raise errors[0]
+        return b''.join(received)
+
+    def compress(self, chunks, **parameters):
+        """ Compress chunks of bits in a session. """
+        return self.run(chunks, 'compress', **parameters)
+
+    def decompress(self, chunks, **parameters):
+        """ Decompress chunks of compressed bits in a session. """
+        return self.run(chunks, 'decompress', **parameters)
+
+    def getMetrics(self):
+        """ Get the metrics of the sessions of the service. """
+        connection, response = self.connect({'mode': 'metrics'})
+        connection.close()
+        return response['sessions']
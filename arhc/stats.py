@@ -0,0 +1,111 @@
+import math
+from collections import Counter
+from timeit import default_timer
+
+
+class Stats:
+
+    """
+    Counters and timers of the hot path of the ARHC. A compressor records
+    into its stats object only if it has one, so that it costs nothing
+    otherwise.
+
+    Every symbol is accounted for in two phases: building its Huffman code,
+    which is mostly a cache lookup, and encoding or decoding it. The
+    information content of a symbol under the probability model that its
+    code is built for adds up to the entropy that the code lengths are
+    compared with.
+    """
+
+    timer = staticmethod(default_timer)
+
+    def __init__(self):
+        self.builds = 0
+        self.constructions = 0
+        self.bankLoads = 0
+        self.reuses = 0
+        self.buildTime = 0.0
+        self.codeTime = 0.0
+        self.runLengths = Counter()
+        self.symbols = 0
+        self.codeBits = 0
+        self.entropyBits = 0.0
+        self.bitsIn = 0
+        self.bitsOut = 0
+        self.start = 0.0
+        self.misses = 0
+        self.loads = 0
+        self.reused = 0
+
+    def startBuild(self, arhc):
+        """ Mark the start of building a Huffman code. """
+        self.misses = arhc.cache.misses
+        self.loads = getBankLoads(arhc.cache)
+        self.reused = arhc.reuses
+        self.start = self.timer()
+
+    def endBuild(self, arhc):
+        """ Mark the end of building a Huffman code. """
+        now = self.timer()
+        self.buildTime += now - self.start
+        self.start = now
+        self.builds += 1
+        loads = getBankLoads(arhc.cache) - self.loads
+        reused = arhc.reuses - self.reused
+        self.bankLoads += loads
+        self.reuses += reused
+        self.constructions += arhc.cache.misses - self.misses - loads - \
+            reused
+        self.runLengths[arhc.runLength] += 1
+
+    def endSymbol(self, arhc, zeros, ones, codeLength):
+        """ Mark the end of encoding or decoding a symbol of a number of
+            zeros and ones to a code of a length. """
+        self.codeTime += self.timer() - self.start
+        self.symbols += 1
+        self.codeBits += codeLength
+        prob1 = arhc.getPredictive1()
+        self.entropyBits -= zeros * math.log(1 - prob1, 2) + \
+            ones * math.log(prob1, 2)
+
+    def endStreams(self, inStream, outStream):
+        """ Count the bits read and written by a compression or
+            decompression. """
+        self.bitsIn += inStream.bitsRead
+        self.bitsOut += outStream.bitsWritten
+
+    def merge(self, other):
+        """ Add the counters and timers of other stats. """
+        for name in ['builds', 'constructions', 'bankLoads', 'reuses',
+                     'buildTime', 'codeTime', 'symbols', 'codeBits',
+                     'entropyBits', 'bitsIn', 'bitsOut']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.runLengths.update(other.runLengths)
+
+    def summary(self):
+        """ Summarize the statistics. """
+        symbols = max(1, self.symbols)
+        runLengths = ', '.join('{} x {}'.format(runLength, count)
+                               for runLength, count
+                               in self.runLengths.most_common(5))
+        return '\n'.join([
+            'Symbols:             {}'.format(self.symbols),
+            'Huffman builds:      {} ({} constructed, {} from bank, {} '
+            'reused)'.format(self.builds, self.constructions, self.bankLoads,
+                             self.reuses),
+            'Build time:          {:.4f} s'.format(self.buildTime),
+            'Encode/decode time:  {:.4f} s'.format(self.codeTime),
+            'Average code length: {:.3f} bits (entropy {:.3f} bits)'.format(
+                self.codeBits / float(symbols),
+                self.entropyBits / symbols),
+            'Bits in:             {} ({} bytes)'.format(
+                self.bitsIn, (self.bitsIn + 7) // 8),
+            'Bits out:            {} ({} bytes)'.format(
+                self.bitsOut, (self.bitsOut + 7) // 8),
+            'Run-lengths:         {}'.format(runLengths or '-')
+        ]) + '\n'
+
+
+def getBankLoads(cache):
+    """ Get the number of symbol codes that a cache took from its bank. """
+    return cache.bank.loads if cache.bank is not None else 0
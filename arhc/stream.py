@@ -1,33 +1,182 @@
+import binascii
+import os
+import threading
+
+
 class Stream:
     """
     Encapsulation of a communication channel where the number of bits to be
     read or to be written is specified.
 
-    :param stream: Communication channel.
-    :param N:      Number of bits to be read or to be written.
+    In ASCII mode every bit is represented by the character '0' or '1'. In
+    packed mode the channel carries raw bytes of which the bits are taken
+    most significant bit first; the final byte written is padded with zeros
+    and any bits beyond N in the final byte read are ignored.
+
+    Bits are read from the channel as they become available, so reading
+    waits only for bits that are needed and never for bits beyond them.
+    They are pulled in chunks of up to chunkSize bytes or characters into a
+    buffer, from which they are served by advancing a position; the consumed
+    bits are only dropped when the buffer is refilled.
+    Written bits are flushed to the channel according to a policy:
+    'interactive' flushes on every write, 'throughput' flushes only when
+    bufferBits bits are pending and at the end, and 'timed' additionally
+    flushes pending bits within an interval.
+
+    :param stream:        Communication channel.
+    :param N:             Number of bits to be read or to be written.
+    :param packed:        Read and write packed bytes instead of ASCII
+                          characters.
+    :param flush:         Flush policy, one of policies.
+    :param flushInterval: Interval in milliseconds within which the 'timed'
+                          policy flushes.
     """
 
     bitsRead = 0
     bitsWritten = 0
+    chunkSize = 1 << 16
+    bufferBits = 1 << 19
+    policies = ['interactive', 'throughput', 'timed']
 
-    def __init__(self, stream, N):
+    def __init__(self, stream, N, packed=False, flush='interactive',
+                 flushInterval=100):
+        if flush not in self.policies:
+            raise ValueError('unknown flush policy "{}"'.format(flush))
         self.stream = stream
         self.N = N
+        self.packed = packed
+        self.flushPolicy = flush
+        self.flushInterval = flushInterval
+        self.readBuffer = ''
+        self.readPosition = 0
+        self.writeBuffer = ''
+        self.pending = []
+        self.pendingBits = 0
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def pull(self, size):
+        """ Read up to a number of bytes or characters from the channel,
+            waiting only until any are available. """
+        if hasattr(self.stream, 'read1'):
+            contents = self.stream.read1(size)
+        else:
+            try:
+                contents = os.read(self.stream.fileno(), size)
+            except (AttributeError, IOError, OSError, ValueError):
+                contents = self.stream.read(size)
+        if not self.packed and not isinstance(contents, str):
+            contents = bytes(contents).decode('ascii')
+        return contents
+
+    def fill(self, num):
+        """ Pull bits from the channel until at least a number of bits is
+            buffered. Returns False if the channel is exhausted before. """
+        while self.bitsBuffered() < num:
+            missing = num - self.bitsBuffered()
+            if self.packed:
+                contents = self.pull(max((missing + 7) // 8, self.chunkSize))
+                bits = unpackBits(contents)
+            else:
+                contents = self.pull(max(missing, self.chunkSize))
+                bits = ''.join(contents.split())
+            if not contents:
+                return False
+            self.readBuffer = self.readBuffer[self.readPosition:] + bits
+            self.readPosition = 0
+        return True
+
+    def bitsBuffered(self):
+        """ Get the number of bits that are buffered but not yet read. """
+        return len(self.readBuffer) - self.readPosition
+
+    def peek(self, num=1):
+        """ Look at up to a number of bits from the channel without consuming
+            them. Waits only if no bits are available at all. """
+        if self.readPosition == len(self.readBuffer):
+            self.fill(1)
+        return self.readBuffer[self.readPosition:self.readPosition + num]
 
     def read(self, num=1):
         """ Read from the channel. """
-        contents = self.stream.read(num)
+        self.fill(num)
+        contents = self.readBuffer[self.readPosition:self.readPosition + num]
+        self.readPosition += len(contents)
         self.bitsRead += len(contents)
         self.observerRead(contents)
         return contents
 
+    def readToEnd(self):
+        """ Read all bits until the channel is exhausted. """
+        while self.fill(self.bitsBuffered() + 1):
+            pass
+        return self.read(self.bitsBuffered())
+
+    def readRun(self, cap):
+        """ Read zeros up to and including the first one, but read no more
+            than a maximum number of zeros. Returns the number of zeros
+            read. """
+        scanned = 0
+        while True:
+            start = self.readPosition
+            end = self.readBuffer.find('1', start + scanned, start + cap)
+            if end >= 0:
+                self.read(end - start + 1)
+                return end - start
+            scanned = self.bitsBuffered()
+            if scanned >= cap or not self.fill(scanned + 1):
+                return len(self.read(min(scanned, cap)))
+
     def write(self, string):
         """ Write to the channel. """
         self.bitsWritten += len(string)
         self.observerWrite(string)
-        self.stream.write(string)
+        with self.lock:
+            self.pending.append(string)
+            self.pendingBits += len(string)
+            if self.flushPolicy == 'interactive' or \
+                    self.pendingBits >= self.bufferBits:
+                self.flushPending()
+            elif self.flushPolicy == 'timed' and self.timer is None:
+                self.timer = threading.Timer(self.flushInterval / 1000.0,
+                                             self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flushPending(self, final=False):
+        """ Write the pending bits to the channel and flush it. In packed mode
+            an incomplete final byte is kept back unless this is the final
+            flush, in which case it is padded with zeros. """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        contents = ''.join(self.pending)
+        self.pending = []
+        self.pendingBits = 0
+        if self.packed:
+            contents = self.writeBuffer + contents
+            if final:
+                contents += '0' * (-len(contents) % 8)
+            complete = len(contents) - len(contents) % 8
+            self.writeBuffer = contents[complete:]
+            contents = packBits(contents[:complete])
+        if contents:
+            self.stream.write(contents)
         self.stream.flush()
 
+    def flush(self):
+        """ Write any pending bits to the channel, keeping back an incomplete
+            final byte in packed mode. """
+        with self.lock:
+            if self.pending:
+                self.flushPending()
+
+    def finish(self):
+        """ Write any pending bits to the channel, padding the final byte with
+            zeros in packed mode. """
+        with self.lock:
+            self.flushPending(final=True)
+
     def bitsLeftToRead(self):
         """ Get number of bits left to read. """
         return self.N - self.bitsRead
@@ -51,3 +200,48 @@ class Stream:
     def observeWrite(self, observer):
         """ Set a function that will be called when any bits are written. """
         self.observerWrite = observer
+
+
+def packBits(string):
+    """ Pack a string of bits, whose length is a multiple of eight, into
+        bytes, most significant bit first. """
+    # Conversions between binary and hexadecimal take linear time
+    if not string:
+        return b''
+    return binascii.unhexlify('{:0{}x}'.format(int(string, 2),
+                                               len(string) // 4))
+
+
+def unpackBits(contents):
+    """ Unpack bytes into a string of bits, most significant bit first. """
+    if not contents:
+        return ''
+    return '{:0{}b}'.format(int(binascii.hexlify(contents), 16),
+                            8 * len(contents))
+
+
+def readExactly(channel, size, allowEOF=False, name='contents'):
+    """ Read a number of bytes from a channel of bytes. Raises a ValueError
+        that names what is read if the channel is exhausted first, unless
+        allowEOF is set and no bytes were read, in which case None is
+        returned. """
+    contents = b''
+    while len(contents) < size:
+        chunk = channel.read(size - len(contents))
+        if not chunk:
+            if allowEOF and not contents:
+                return None
+            raise ValueError('truncated {}'.format(name))
+        contents += chunk
+    return contents
+
+
+def binary(value, width):
+    """ Write a value in binary with a number of bits. """
+    return format(value, 'b').zfill(width) if width > 0 else ''
+
+
+def readBinary(stream, width):
+    """ Read a value written in binary with a number of bits. """
+    bits = stream.read(width) if width > 0 else ''
+    return int(bits, 2) if bits else 0
@@ -0,0 +1,159 @@
+import sys
+import numpy as np
+from arhc import ARHC
+from stream import Stream
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class VectorizedARHC(ARHC):
+
+    """
+    Adaptive Run-length Huffman Compressor for a constant probability of one
+    that processes all bits at once with NumPy. Produces exactly the output
+    of ARHC.
+
+    All symbols but the last few are encoded with the code of the full
+    run-length, so that their code symbols follow from the runs of zeros
+    between ones by table lookups. The last few symbols, which fall within a
+    run-length of the end and use shorter codes, are processed one by one.
+
+    :param prob1: Probability of one, which must be constant.
+    :param cache: Cache of symbol codes, a fresh CodebookCache by default.
+    """
+
+    def __init__(self, prob1, cache=None):
+        ARHC.__init__(self, prob1, cache)
+        self.buildHuffman(sys.maxsize)
+        self.fullRunLength = self.runLength
+        codes = [self.encodeRun(run) for run in range(self.runLength + 1)]
+        self.codeLengths = np.array([len(code) for code in codes])
+        self.codeBits = np.zeros((len(codes), self.codeLengths.max()),
+                                 dtype=np.uint8)
+        for run, code in enumerate(codes):
+            self.codeBits[run, :len(code)] = fromString(code)
+        self.codeValues = np.array([int(code, 2) for code in codes])
+
+    def compressBits(self, bits):
+        """ Compress an array of bits to an array of code bits. """
+        N, runLength = len(bits), self.fullRunLength
+        ones = np.flatnonzero(bits)
+        starts = np.concatenate(([0], ones + 1))
+        gaps = np.concatenate((ones, [N])) - starts
+
+        # Split every run of zeros into full run-lengths and a remainder
+        counts = gaps // runLength + 1
+        firsts = np.cumsum(counts) - counts
+        runs = np.full(counts.sum(), runLength, dtype=np.int64)
+        runs[firsts + counts - 1] = gaps % runLength
+        offsets = np.arange(len(runs)) - np.repeat(firsts, counts)
+        symbolStarts = np.repeat(starts, counts) + offsets * runLength
+
+        # Symbols that start within a run-length of the end use other codes
+        cut = np.searchsorted(symbolStarts, N - runLength, side='right')
+        runs = runs[:cut]
+        mask = np.arange(self.codeBits.shape[1]) < \
+            self.codeLengths[runs][:, None]
+        head = self.codeBits[runs][mask]
+
+        tail = []
+        position = symbolStarts[cut]
+        string = toString(bits[position:])
+        while position < N:
+            self.buildHuffman(N - position)
+            offset = N - len(string)
+            run = string.find('1', position - offset,
+                              position - offset + self.runLength)
+            if run < 0:
+                run = self.runLength
+                position += run
+            else:
+                run -= position - offset
+                position += run + 1
+            tail.append(self.encodeRun(run))
+        return np.concatenate((head, fromString(''.join(tail))))
+
+    def decompressBits(self, code, N):
+        """ Decompress an array of code bits to an array of N bits. """
+        runLength, width = self.fullRunLength, self.codeBits.shape[1]
+        if width > 62:
+            return self.decompressBitsSerially(code, 0, N)
+
+        # Decode a symbol at every position of the code bits
+        padded = np.concatenate((code, np.zeros(width, dtype=np.uint8)))
+        windows = np.zeros(len(code), dtype=np.int64)
+        for i in range(width):
+            windows = (windows << 1) | padded[i:i + len(code)]
+        lefts = self.codeValues << (width - self.codeLengths)
+        order = np.argsort(lefts)
+        symbols = order[np.searchsorted(lefts[order], windows,
+                                        side='right') - 1]
+
+        # Follow the chain of symbols from the start by pointer doubling
+        M = len(code)
+        jumps = np.append(np.minimum(np.arange(M) + self.codeLengths[symbols],
+                                     M), M)
+        path = np.array([0])
+        while path[-1] < M:
+            path = np.concatenate((path, jumps[path]))
+            jumps = jumps[jumps]
+        path = path[path < M]
+
+        # Symbols that start within a run-length of the end use other codes
+        runs = symbols[path]
+        lengths = np.where(runs < runLength, runs + 1, runLength)
+        outStarts = np.cumsum(lengths) - lengths
+        cut = np.searchsorted(outStarts, N - runLength, side='right')
+        bits = np.zeros(N, dtype=np.uint8)
+        terminated = runs[:cut] < runLength
+        bits[(outStarts[:cut] + runs[:cut])[terminated]] = 1
+        if cut < len(path):
+            return self.decompressBitsSerially(code, path[cut], N,
+                                               outStarts[cut], bits)
+        return self.decompressBitsSerially(code, M, N, lengths.sum(), bits)
+
+    def decompressBitsSerially(self, code, codePosition, N, position=0,
+                               bits=None):
+        """ Decompress code bits from a position onwards symbol by symbol,
+            which continues a decompression up to a position. """
+        if bits is None:
+            bits = np.zeros(N, dtype=np.uint8)
+        inStream = Stream(StringIO(toString(code[codePosition:])), None)
+        while position < N:
+            self.buildHuffman(N - position)
+            zeros, ones = self.decodeRun(self.huffman.decode(inStream))
+            bits[position + zeros:position + zeros + ones] = 1
+            position += zeros + ones
+        return bits
+
+    def compress(self, inStream, outStream):
+        """ Compress the contents of a stream and write the compressed
+            contents to another stream. Raises a ValueError if the stream
+            ends before its number of bits is read. """
+        bits = fromString(inStream.read(inStream.bitsLeftToRead()))
+        if inStream.bitsLeftToRead() > 0:
+            raise ValueError('input shorter than N = {} bits'.format(
+                inStream.N))
+        outStream.write(toString(self.compressBits(bits)))
+        outStream.finish()
+
+    def decompress(self, inStream, outStream):
+        """ Decompress the contents of a stream, which is read up to its end,
+            and write the decompressed contents to another stream. """
+        code = fromString(inStream.readToEnd())
+        outStream.write(toString(
+            self.decompressBits(code, outStream.bitsLeftToWrite())))
+        outStream.finish()
+
+
+def fromString(string):
+    """ Convert a string of bits to an array of bits. """
+    return np.frombuffer(string.encode('ascii'), dtype=np.uint8) - ord('0')
+
+
+def toString(bits):
+    """ Convert an array of bits to a string of bits. """
+    return str((bits + ord('0')).astype(np.uint8).tobytes().decode('ascii'))
@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 
+import io
 import sys
 import textwrap
-import time
-from arhc.arhc import ARHC
-from arhc.probability import ConstantProbability, AdaptiveProbability
+from arhc.bank import CodebookBank
+from arhc.block import Blocks
+from arhc.cache import CodebookCache
+from arhc.container import Container, Header
+from arhc.mapped import MappedInput, MappedOutput
+from arhc.server import Server
+from arhc.service import CompressionService
+from arhc.stats import Stats
 from arhc.stream import Stream
 
 
@@ -12,6 +18,12 @@ class Main:
 
     """
     Parsing of command-line arguments and invoking the ARHC.
+
+    :param argv:   Arguments, those of the command line by default.
+    :param stdin:  Input channel, standard input by default.
+    :param stdout: Output channel, standard output by default.
+    :param stderr: Channel of messages, standard error by default.
+    :param caches: Caches of symbol codes to reuse, by their parameters.
     """
 
     usage = textwrap.dedent('''
@@ -20,14 +32,75 @@ class Main:
 
     Usage:
         arhc.py < inputFile > outputFile
+        arhc.py --input inputFile --output outputFile
 
     Flags:
         --decompress         Decompress inputFile
-        --N length           Length of inputFile, default 10000
+        --N length           Length of inputFile, default 10000, or the
+                             number of bits in the file of --input when
+                             compressing
+        --input file         Read inputFile from a file, which is memory-
+                             mapped, instead of from stdin
+        --output file        Write outputFile to a file, which is memory-
+                             mapped, instead of to stdout
+        --stream             Compress inputFile up to its end, whatever its
+                             length, and mark the end in the compressed file
+        --packed             Read and write packed bytes, most significant
+                             bit first, instead of the characters '0' and
+                             '1'; the final byte is padded with zeros
+        --flush policy       When to flush the output: "throughput" when
+                             the buffer is full, "interactive" after every
+                             symbol, or "timed" at least every --flush-ms
+                             milliseconds, default throughput
+        --flush-ms interval  Interval of the timed flush policy, default 100
+        --stats              Print statistics of the Huffman codes to stderr
+
+        Serving
+        --serve              Keep running and answer framed requests from
+                             stdin, which hold the flags and the inputFile of
+                             a job, keeping symbol codes between jobs
+        --socket file        Answer framed requests from a Unix socket
+                             instead of stdin
+        --listen host:port   Run a network service in which every connection
+                             compresses or decompresses its own bits in
+                             streaming mode as they arrive
+        --max-sessions num   Maximum number of concurrent connections of the
+                             service, default 64
+        --session-timeout s  Seconds after which an idle connection is
+                             closed, default 60
+        --memory-cap bits    Maximum number of bits a connection may hold,
+                             default 1048576
         --help               Show this information
 
+        Container
+        --container          Write a self-describing container when
+                             compressing and read one when decompressing, in
+                             which case all other flags but --range and --jobs
+                             are taken from the container
+        --range start:end    Decompress only the bits [start, end)
+
+        Blocks
+        --block-size length  Compress blocks of this many bits independently,
+                             default 0 for a single block
+        --jobs number        Number of processes that compress blocks
+                             concurrently, default 1
+
+        Symbol codes
+        --cache-size number  Number of symbol codes kept for reuse, default
+                             1024
+        --quantize number    Quantize the probability of one onto a grid of
+                             this many points, default 0 for no quantization
+        --bank file          Take symbol codes from a bank of precomputed
+                             codes, which sets --quantize to its grid
+        --build-bank file    Precompute the symbol codes for the grid of
+                             --quantize, write them to a bank and exit
+        --canonical          Use canonical codes, which are stored in flat
+                             arrays, instead of Huffman trees
+
         Static compression
         --prob1 value        Probability of one, default 0.01
+        --golomb             Use a Golomb code instead of Huffman codes
+        --vectorized         Process all bits at once with NumPy
 
         Adaptive compression
         --adaptive           Use adaptive compression scheme
@@ -43,22 +116,66 @@ class Main:
     arguments = {
         'decompress': False,
         'N':          10000,
+        'input':      '',
+        'output':     '',
+        'stream':     False,
+        'packed':     False,
+        'flush':      'throughput',
+        'flush-ms':   100,
+        'stats':      False,
+        'serve':      False,
+        'socket':     '',
+        'listen':     '',
+        'max-sessions': 64,
+        'session-timeout': 60.0,
+        'memory-cap': 1 << 20,
+        'container':  False,
+        'range':      '',
         'adaptive':   False,
         'alpha0':     0.5,
         'alpha1':     0.5,
         'prob1':      0.01,
+        'golomb':     False,
+        'vectorized': False,
+        'canonical':  False,
+        'block-size': 0,
+        'jobs':       1,
+        'cache-size': 1024,
+        'quantize':   0,
+        'bank':       '',
+        'build-bank': '',
         'help':       False
     }
 
+    # Flags of a job that a served request may set; the others name files or
+    # start a server
+    jobFlags = ['decompress', 'N', 'stream', 'packed', 'flush', 'flush-ms',
+                'stats', 'container', 'range', 'block-size', 'jobs',
+                'cache-size', 'quantize', 'canonical', 'prob1', 'golomb',
+                'vectorized', 'adaptive', 'alpha0', 'alpha1', 'help']
+
+    def __init__(self, argv=None, stdin=None, stdout=None, stderr=None,
+                 caches=None):
+        self.arguments = dict(self.arguments)
+        self.argv = sys.argv[1:] if argv is None else argv  # Skip file name
+        self.stdin = sys.stdin if stdin is None else stdin
+        self.stdout = sys.stdout if stdout is None else stdout
+        self.stderr = sys.stderr if stderr is None else stderr
+        # Caches given by a server are kept for later jobs
+        self.ownsCaches = caches is None
+        self.caches = {} if caches is None else caches
+        self.inFile = None
+        self.outFile = None
+
     def error(self, message):
         """ Display an error message and terminate. """
-        sys.stderr.write(message[0].capitalize() + message[1:] + '\n')
-        sys.stderr.write('Use "arhc.py --help" to view more information.\n')
-        exit()
+        self.stderr.write(message[0].capitalize() + message[1:] + '\n')
+        self.stderr.write('Use "arhc.py --help" to view more information.\n')
+        sys.exit(1)
 
     def parseArguments(self):
         """ Loop through the arguments and verify their syntax. """
-        iterator = iter(sys.argv[1:])  # Skip file name
+        iterator = iter(self.argv)
         for argument in iterator:
             if len(argument) < 2 or argument[:2] != '--':
                 self.error('syntax error "{}"'.format(argument))
@@ -84,26 +201,300 @@ class Main:
         except (ValueError, TypeError):
             self.error('incorrect type "{}"'.format(value))
 
+    def parseRange(self):
+        """ Parse the range of bits to decompress. """
+        if not self.arguments['range']:
+            return 0, None
+        try:
+            start, end = self.arguments['range'].split(':')
+            start, end = int(start or 0), int(end) if end else None
+        except ValueError:
+            self.error('incorrect range "{}"'.format(self.arguments['range']))
+        if start < 0 or (end is not None and (end < 0 or end < start)):
+            self.error('range "{}" must satisfy 0 <= start <= end'.format(
+                self.arguments['range']))
+        return start, end
+
+    def createHeader(self):
+        """ Describe the compressed contents as specified by the
+            arguments. """
+        if sum([self.arguments['golomb'], self.arguments['vectorized'],
+                self.arguments['canonical']]) > 1:
+            self.error('choose one of --golomb, --vectorized and --canonical')
+        if self.arguments['adaptive'] and self.arguments['golomb']:
+            self.error('Golomb code requires static compression')
+        if self.arguments['adaptive'] and self.arguments['vectorized']:
+            self.error('vectorized compression requires static compression')
+        if self.arguments['golomb']:
+            engine = 'golomb'
+        elif self.arguments['vectorized']:
+            engine = 'vectorized'
+        elif self.arguments['canonical']:
+            engine = 'canonical'
+        else:
+            engine = 'huffman'
+        return Header(self.arguments['N'], self.arguments['adaptive'],
+                      self.arguments['prob1'], self.arguments['alpha0'],
+                      self.arguments['alpha1'], engine,
+                      self.arguments['quantize'], self.arguments['packed'],
+                      self.arguments['block-size'])
+
+    def getChannels(self, packed):
+        """ Get the input and output channels in ASCII or packed mode, which
+            are the files of --input and --output if they are given. """
+        if packed:
+            channels = (getattr(self.stdin, 'buffer', self.stdin),
+                        getattr(self.stdout, 'buffer', self.stdout))
+        else:
+            channels = (self.stdin, self.stdout)
+        return self.inFile or channels[0], self.outFile or channels[1]
+
+    def openFiles(self):
+        """ Map the files of --input and --output. The output is
+            preallocated to its final size if it is known, and to the size
+            of the input otherwise. """
+        try:
+            if self.arguments['input']:
+                self.inFile = MappedInput(self.arguments['input'])
+                if not self.arguments['decompress'] and \
+                        '--N' not in self.argv:
+                    self.arguments['N'] = self.inFile.countBits(
+                        self.arguments['packed'])
+            if self.arguments['output']:
+                if self.arguments['decompress'] and \
+                        not self.arguments['container'] and \
+                        not self.arguments['stream']:
+                    size = self.arguments['N']
+                    if self.arguments['packed']:
+                        size = (size + 7) // 8
+                else:
+                    size = self.inFile.size if self.inFile else 1 << 20
+                self.outFile = MappedOutput(self.arguments['output'], size)
+        except (IOError, OSError, ValueError) as e:
+            self.error(str(e))
+
+    def closeFiles(self):
+        """ Unmap the files of --input and --output. """
+        for channel in [self.inFile, self.outFile]:
+            if channel is not None:
+                channel.close()
+        self.inFile = self.outFile = None
+
+    def closeBanks(self):
+        """ Unmap the banks of the caches, unless the caches are kept for
+            later jobs. """
+        if self.ownsCaches:
+            for cache in self.caches.values():
+                if cache.bank is not None:
+                    cache.bank.close()
+
+    def createOutStream(self, channel, N, packed):
+        """ Create the stream that is written to, flushed as specified by the
+            arguments. """
+        if self.arguments['flush'] not in Stream.policies:
+            self.error('unknown flush policy "{}"'.format(
+                self.arguments['flush']))
+        return Stream(channel, N, packed, self.arguments['flush'],
+                      self.arguments['flush-ms'])
+
+    def createCache(self):
+        """ Create the cache of symbol codes, backed by a bank if one is
+            specified, or reuse the cache of earlier jobs. """
+        key = (self.arguments['cache-size'], self.arguments['quantize'],
+               self.arguments['bank'])
+        if key not in self.caches:
+            self.caches[key] = self.createNewCache()
+        # A bank sets the quantization of its cache
+        self.arguments['quantize'] = self.caches[key].quantization
+        return self.caches[key]
+
+    def createNewCache(self):
+        """ Create a cache of symbol codes, backed by a bank if one is
+            specified. """
+        bank = None
+        if self.arguments['bank']:
+            try:
+                bank = CodebookBank(self.arguments['bank'])
+            except (IOError, ValueError) as e:
+                self.error(str(e))
+            if self.arguments['quantize'] == 0:
+                self.arguments['quantize'] = bank.quantization
+            elif self.arguments['quantize'] != bank.quantization:
+                self.error('--quantize differs from the grid of the bank')
+        return CodebookCache(self.arguments['cache-size'],
+                             self.arguments['quantize'], bank)
+
+    def instrument(self, engine, header):
+        """ Record statistics of a compressor if requested. """
+        if self.stats is not None:
+            if header.engine not in ['huffman', 'canonical']:
+                self.error('--stats requires Huffman codes')
+            engine.stats = self.stats
+        return engine
+
+    def runContainer(self, cache):
+        """ Compress to or decompress from a container. """
+        if self.arguments['stream']:
+            self.error('a container requires a known number of bits, not '
+                       '--stream')
+        if self.arguments['decompress']:
+            inChannel = self.getChannels(True)[0]
+            try:
+                container = Container.read(inChannel, self.arguments['jobs'],
+                                           cache)
+            except ValueError as e:
+                self.error(str(e))
+            self.instrument(container.blocks.engine, container.header)
+            start, end = self.parseRange()
+            end = container.header.N if end is None else \
+                min(end, container.header.N)
+            outChannel = self.getChannels(container.header.packed)[1]
+            container.decompress(inChannel, self.createOutStream(
+                outChannel, max(0, end - start), container.header.packed),
+                start, end)
+        else:
+            inChannel = self.getChannels(self.arguments['packed'])[0]
+            header = self.createHeader()
+            try:
+                container = Container(header, self.arguments['jobs'], cache)
+            except ValueError as e:
+                self.error(str(e))
+            self.instrument(container.blocks.engine, header)
+            try:
+                container.compress(Stream(inChannel, self.arguments['N'],
+                                          self.arguments['packed']),
+                                   self.getChannels(True)[1])
+            except ValueError as e:
+                self.error(str(e))
+
+    def runStreaming(self, cache):
+        """ Compress or decompress in streaming mode. """
+        if self.arguments['golomb'] or self.arguments['vectorized'] or \
+                self.arguments['block-size'] > 0:
+            self.error('streaming mode requires Huffman codes and a single '
+                       'block')
+        header = self.createHeader()
+        arhc = self.instrument(header.createEngine(cache), header)
+        channels = self.getChannels(self.arguments['packed'])
+        streams = (Stream(channels[0], None, self.arguments['packed']),
+                   self.createOutStream(channels[1], None,
+                                        self.arguments['packed']))
+        if self.arguments['decompress']:
+            try:
+                arhc.decompressStreaming(*streams)
+            except ValueError as e:
+                self.error(str(e))
+        else:
+            arhc.compressStreaming(*streams)
+
+    def handle(self, header, payload):
+        """ Run the job of a framed request and return the response. """
+        for flag in header.get('args', []):
+            if flag[:2] == '--' and flag[2:] not in self.jobFlags:
+                return {'status': 1,
+                        'error': '{} cannot be requested'.format(flag)}, b''
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        main = Main(header.get('args', []), io.BytesIO(payload), stdout,
+                    stderr, self.caches)
+        response = {'status': 0}
+        try:
+            main.run()
+        except SystemExit:
+            response['status'] = 1
+        except Exception as e:
+            response = {'status': 1, 'error': str(e)}
+        response['stderr'] = stderr.getvalue().decode('utf-8')
+        return response, stdout.getvalue()
+
+    def serve(self):
+        """ Answer framed requests until the input is exhausted. """
+        server = Server(self.handle)
+        if self.arguments['socket']:
+            server.serveUnix(self.arguments['socket'])
+        else:
+            server.serve(*self.getChannels(True))
+
+    def listen(self):
+        """ Run the network service until interrupted. """
+        host, _, port = self.arguments['listen'].rpartition(':')
+        try:
+            service = CompressionService(
+                (host or '127.0.0.1', int(port)),
+                self.arguments['max-sessions'],
+                self.arguments['session-timeout'],
+                self.arguments['memory-cap'])
+        except (ValueError, IOError, OSError) as e:
+            self.error('cannot listen on "{}": {}'.format(
+                self.arguments['listen'], e))
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.server_close()
+
+    def runFixedLength(self, cache):
+        """ Compress or decompress a known number of bits. """
+        header = self.createHeader()
+        try:
+            arhc = self.instrument(header.createEngine(cache), header)
+        except ValueError as e:
+            self.error(str(e))
+        if self.arguments['block-size'] > 0:
+            arhc = Blocks(arhc, self.arguments['block-size'],
+                          self.arguments['jobs'])
+        elif self.arguments['jobs'] > 1:
+            self.error('concurrent compression requires --block-size')
+        channels = self.getChannels(self.arguments['packed'])
+        streams = (Stream(channels[0], self.arguments['N'],
+                          self.arguments['packed']),
+                   self.createOutStream(channels[1], self.arguments['N'],
+                                        self.arguments['packed']))
+        if self.arguments['decompress']:
+            arhc.decompress(*streams)
+        else:
+            try:
+                arhc.compress(*streams)
+            except ValueError as e:
+                self.error(str(e))
+
     def run(self):
         """ Top-level logic of the ARHC. """
         self.parseArguments()
         if self.arguments['help']:
-            sys.stdout.write(self.usage)
-        else:
-            if self.arguments['adaptive']:
-                arhc = ARHC(AdaptiveProbability(
-                    self.arguments['alpha0'], self.arguments['alpha1']))
-            else:
-                arhc = ARHC(ConstantProbability(self.arguments['prob1']))
-            streams = (Stream(sys.stdin, self.arguments['N']), Stream(
-                sys.stdout, self.arguments['N']))
-            if self.arguments['decompress']:
-                arhc.decompress(*streams)
+            self.stdout.write(self.usage)
+            return
+        if self.arguments['serve']:
+            self.serve()
+            return
+        if self.arguments['listen']:
+            self.listen()
+            return
+        if self.arguments['build-bank']:
+            if self.arguments['quantize'] <= 0:
+                self.error('--build-bank requires --quantize')
+            CodebookBank.write(self.arguments['build-bank'],
+                               self.arguments['quantize'])
+            return
+        cache = self.createCache()
+        self.stats = Stats() if self.arguments['stats'] else None
+        self.openFiles()
+        try:
+            if self.arguments['container']:
+                self.runContainer(cache)
+            elif self.arguments['range']:
+                self.error('--range requires --container')
+            elif self.arguments['stream']:
+                self.runStreaming(cache)
             else:
-                arhc.compress(*streams)
+                self.runFixedLength(cache)
+        finally:
+            self.closeFiles()
+            self.closeBanks()
+        if self.stats is not None:
+            self.stderr.write(self.stats.summary())
 
 
 if __name__ == '__main__':
     main = Main()
     main.run()
-    time.sleep(0.1)  # Keep process alive for just another bit
@@ -35,6 +35,7 @@ class Test:
 
     def run(self, args):
         bitsCopy = list(self.bits)
+        args = ['--flush', 'interactive'] + args
         pDecomp = Popen(['./unsquash'] + args, stdin=PIPE, stdout=PIPE)
         pComp = Popen(['./squash'] + args, stdin=PIPE, stdout=PIPE)
 
@@ -1,11 +1,41 @@
 #!/usr/bin/env python
 
+import hashlib
+import io
+import itertools
 import math
 import os
+import re
 import sys
-from subprocess import Popen, PIPE
+import tempfile
+from subprocess import Popen, PIPE, check_call
 from random import random
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arhc.analysis import LengthDistribution
+from arhc.arhc import ARHC
+from arhc.block import Blocks
+from arhc.codec import (ARHCFile, compress, decompress, iterCompress,
+                        iterDecompress)
+from arhc.container import Container, Header, skip
+from arhc.huffman import Huffman
+from arhc.probability import AdaptiveProbability, ConstantProbability
+from arhc.server import readFrame, writeFrame
+from arhc.stream import Stream
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+# Digests of the output of the original implementation for
+# tests/benchmark.txt, which compressed files depend on staying decodable
+goldenDigests = [(['--prob1', '0.01', '--N', '10000'],
+                  '7b66b002a30e02be8a506974d6db2e1c'),
+                 (['--N', '10000', '--adaptive'],
+                  '68c36e7d09d62bfebea3de2b6dbf255f')]
+
 
 class Test:
 
@@ -16,14 +46,79 @@ class Test:
         pComp = Popen(['./squash'] + args, stdin=PIPE, stdout=PIPE)
         pDecomp = Popen(['./unsquash'] + args, stdin=PIPE, stdout=PIPE)
         pComp.stdin.write(self.bits)
+        pComp.stdin.close()
         outComp = pComp.stdout.read()
         pDecomp.stdin.write(outComp)
+        pDecomp.stdin.close()
         outDecomp = pDecomp.stdout.read()
         pComp.wait()
         pDecomp.wait()
         self.ensureConsistency(outDecomp)
         return outComp
 
+    def runServer(self, args=[]):
+        server = Popen(['./squash', '--serve'], stdin=PIPE, stdout=PIPE)
+        writeFrame(server.stdin, {'args': args}, self.bits)
+        outComp = readFrame(server.stdout)[1]
+        writeFrame(server.stdin, {'args': args + ['--decompress']}, outComp)
+        outDecomp = readFrame(server.stdout)[1]
+        server.stdin.close()
+        server.wait()
+        self.ensureConsistency(outDecomp)
+
+    def runFiles(self, args=[]):
+        directory = tempfile.mkdtemp()
+        paths = [os.path.join(directory, name)
+                 for name in ['bits', 'compressed', 'decompressed']]
+        with open(paths[0], 'wb') as f:
+            f.write(self.bits)
+        check_call(['./squash', '--input', paths[0], '--output', paths[1]] +
+                   args)
+        check_call(['./unsquash', '--input', paths[1], '--output', paths[2]] +
+                   args)
+        with open(paths[2], 'rb') as f:
+            outDecomp = f.read()
+        for path in paths:
+            os.remove(path)
+        os.rmdir(directory)
+        self.ensureConsistency(outDecomp)
+
+    def runRanges(self, args, ranges, rejected):
+        outComp = self.run(args + ['--container'])
+        for start, end in ranges:
+            expected = self.bits[start:end]
+            outRange = self.decompressRange(args, outComp, start, end)[1]
+            if outRange != expected:
+                exit('Range [{}, {}) not consistent with input'.format(start,
+                                                                       end))
+        for start, end in rejected:
+            if self.decompressRange(args, outComp, start, end)[0] == 0:
+                exit('Range [{}, {}) not rejected'.format(start, end))
+            container = Container.read(io.BytesIO(outComp))
+            try:
+                container.decompress(io.BytesIO(), Stream(StringIO(), None),
+                                     start, end)
+            except ValueError:
+                continue
+            exit('Range [{}, {}) not rejected'.format(start, end))
+
+    def decompressRange(self, args, outComp, start, end):
+        pDecomp = Popen(['./unsquash', '--container', '--range',
+                         '{}:{}'.format(start, '' if end is None else end)] +
+                        args, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        outRange = pDecomp.communicate(outComp)[0]
+        return pDecomp.returncode, outRange
+
+    def runLibrary(self, **options):
+        self.ensureConsistency(decompress(compress(self.bits, **options)))
+
+    def runGenerators(self, size, **options):
+        # Chunks of an odd size do not line up with the chunks of the engine
+        chunks = (self.bits[i:i + size]
+                  for i in range(0, len(self.bits), size))
+        outDecomp = iterDecompress(iterCompress(chunks, **options), **options)
+        self.ensureConsistency(type(self.bits)().join(outDecomp))
+
     def ensureConsistency(self, outDecomp):
         if outDecomp != self.bits:
             exit('Decompressed output not consistent with input')
@@ -34,6 +129,223 @@ def bitString(N, p):
                        [random() for _ in range(N)]))
 
 
+def packBits(bits):
+    return bytes(bytearray(int(bits[i:i + 8].ljust(8, '0'), 2)
+                           for i in range(0, len(bits), 8)))
+
+
+def checkLengthDistribution(p, N, adaptive=False, prob1=0.01):
+    # Every input of N bits is compressed, weighted by its probability
+    mean, square = 0.0, 0.0
+    for bits in itertools.product('01', repeat=N):
+        bits = ''.join(bits)
+        output = StringIO()
+        Header(N, adaptive, prob1).createEngine().compress(
+            Stream(StringIO(bits), N), Stream(output, N, flush='throughput'))
+        length = len(output.getvalue())
+        prob = p ** bits.count('1') * (1 - p) ** bits.count('0')
+        mean += prob * length
+        square += prob * length ** 2
+    expected = LengthDistribution().calculate(p, N, adaptive, prob1)
+    if abs(expected[0] - mean) > 1e-9 or \
+            abs(expected[1] - (square - mean ** 2)) > 1e-9:
+        exit('Length distribution not consistent with compression')
+
+
+def checkVectorized(inp, p, N):
+    # The vectorized engine is optional, as it requires NumPy
+    try:
+        import numpy
+    except ImportError:
+        sys.stderr.write('Skipping --vectorized: NumPy is not available\n')
+        return
+    for bits, args in [(inp[:N], ['--N', str(N)]),
+                       (inp[:37], ['--N', '37']),
+                       (packBits(inp[:N]), ['--N', str(N), '--packed'])]:
+        outComp = Test(bits).run(['--prob1', str(p), '--vectorized'] + args)
+        if outComp != Test(bits).run(['--prob1', str(p)] + args):
+            exit('Vectorized output not consistent with ARHC')
+    checkShortInput(['--vectorized'])
+
+
+def checkFile(contents, **options):
+    path = os.path.join(tempfile.mkdtemp(), 'bits.arhc')
+    # Writing fills a member and closing writes the rest as a second one
+    f = ARHCFile(path, 'wb', memberSize=1000, **options)
+    f.write(contents[:600])
+    f.write(contents[600:])
+    f.close()
+    f = ARHCFile(path, 'ab', **options)
+    f.write(contents[:500])
+    f.close()
+    expected = contents + contents[:500]
+
+    with open(path, 'rb') as f:
+        members = []
+        container = Container.readNext(f)
+        while container is not None:
+            members.append(container)
+            skip(f, sum(container.lengths))
+            container = Container.readNext(f)
+        if len(members) != 3:
+            exit('Expected three members instead of {}'.format(len(members)))
+        f.seek(0)
+        if decompress(f.read()) != expected:
+            exit('Members not consistent with input')
+
+    def readAll(read):
+        chunks = []
+        while True:
+            chunk = read()
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    readers = [lambda f: f.read(),
+               lambda f: readAll(lambda: f.read(100)),
+               lambda f: readAll(lambda: f.read1(100)),
+               lambda f: readAll(f.readline),
+               lambda f: io.BufferedReader(f, 64).read()]
+    for reader in readers:
+        f = ARHCFile(path, 'rb')
+        outDecomp = reader(f)
+        f.close()
+        if outDecomp != expected:
+            exit('File contents not consistent with input')
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+class RecentProbability:
+
+    """
+    Probability of one that follows the recent bits, so that it observes
+    every bit separately and cannot be updated with counts.
+    """
+
+    bitLevel = True
+
+    def __init__(self, prob1, rate):
+        self.prob1 = prob1
+        self.rate = rate
+
+    def observe(self, string):
+        for bit in string:
+            self.prob1 += self.rate * ((bit == '1') - self.prob1)
+            self.prob1 = min(max(self.prob1, 0.001), 0.5)
+
+    def observeCounts(self, zeros, ones):
+        raise NotImplementedError('bit-level model given counts')
+
+    def getPredictive1(self):
+        return self.prob1
+
+
+def checkBitLevelStreaming(bits):
+    output = StringIO()
+    ARHC(RecentProbability(0.01, 0.01)).compressStreaming(
+        Stream(StringIO(bits), None), Stream(output, None, flush='throughput'))
+    code = output.getvalue()
+    output = StringIO()
+    ARHC(RecentProbability(0.01, 0.01)).decompressStreaming(
+        Stream(StringIO(code), None), Stream(output, None, flush='throughput'))
+    if output.getvalue() != bits:
+        exit('Bit-level streaming output not consistent with input')
+
+
+def runStats(args, bits):
+    process = Popen(['./squash', '--stats'] + args, stdin=PIPE, stdout=PIPE,
+                    stderr=PIPE)
+    output, summary = process.communicate(bits)
+    counts = dict(re.findall(r'(Symbols|Bits in|Bits out): +(\d+)',
+                             summary.decode('utf-8')))
+    return output, tuple(int(counts.get(name, -1))
+                         for name in ['Symbols', 'Bits in', 'Bits out'])
+
+
+def checkStats():
+    # Every one is a symbol of its own
+    bits = b'1' * 100
+    outComp, counts = runStats(['--N', '100'], bits)
+    if counts != (100, 100, len(outComp)):
+        exit('Stats {} of compression not consistent'.format(counts))
+    outDecomp, counts = runStats(['--N', '100', '--decompress'], outComp)
+    if outDecomp != bits or counts != (100, len(outComp), 100):
+        exit('Stats {} of decompression not consistent'.format(counts))
+    # The stats of the blocks are merged, which excludes the index
+    outComp, counts = runStats(['--N', '100', '--block-size', '30', '--jobs',
+                                '2'], bits)
+    if counts != (100, 100, len(outComp) - 4 * Blocks.indexBits):
+        exit('Stats {} of blocks not consistent'.format(counts))
+
+
+def checkServedFlags():
+    server = Popen(['./squash', '--serve'], stdin=PIPE, stdout=PIPE)
+    # Flags that name files or start a server are refused
+    for args in [['--listen', '127.0.0.1:0'], ['--socket', 'socket'],
+                 ['--build-bank', 'bank', '--quantize', '4'],
+                 ['--bank', 'bank'], ['--input', 'bits'], ['--serve']]:
+        writeFrame(server.stdin, {'args': args}, b'0101')
+        response = readFrame(server.stdout)[0]
+        if response['status'] == 0 or \
+                'cannot be requested' not in response.get('error', ''):
+            exit('Served request with {} not refused'.format(args[0]))
+    server.stdin.close()
+    server.wait()
+
+
+def checkShortInput(args):
+    pComp = Popen(['./squash', '--N', '10000'] + args, stdin=PIPE,
+                  stdout=PIPE, stderr=PIPE)
+    pComp.communicate(b'0001000')
+    if pComp.returncode == 0:
+        exit('Input shorter than N not rejected')
+
+
+def checkTruncatedStream(bits, p):
+    code = b''.join(iterCompress([bits], prob1=p))
+    # The last byte always holds part of the end of the stream
+    for truncated in [b'', code[:len(code) // 2], code[:-1]]:
+        try:
+            for _ in iterDecompress([truncated], prob1=p):
+                pass
+        except ValueError:
+            continue
+        exit('Truncated stream not rejected')
+    pDecomp = Popen(['./unsquash', '--stream', '--packed'], stdin=PIPE,
+                    stdout=PIPE, stderr=PIPE)
+    pDecomp.communicate(code[:-1])
+    if pDecomp.returncode == 0:
+        exit('Truncated stream not rejected')
+
+
+def checkBlockIndex(bits, p):
+    blocks = Blocks(ARHC(ConstantProbability(p)), len(bits))
+    # The compressed block does not fit in an index of few bits
+    blocks.indexBits = 4
+    try:
+        blocks.compress(Stream(StringIO(bits), len(bits)),
+                        Stream(StringIO(), len(bits)))
+    except ValueError:
+        return
+    exit('Compressed block too long for the index not rejected')
+
+
+def checkCodeReuse(p, symbols):
+    arhc = ARHC(AdaptiveProbability(0.5, 0.5))
+    for _ in range(symbols):
+        arhc.buildHuffman(sys.maxsize)
+        if arhc.huffman.codes != \
+                Huffman(arhc.buildSymbols(arhc.runLength)).codes:
+            exit('Reused code not consistent with built code')
+        run = 0
+        while run < arhc.runLength and random() > p:
+            run += 1
+        arhc.prob1.observeCounts(run, 1 if run < arhc.runLength else 0)
+    if arhc.reuses == 0:
+        exit('No codes reused')
+
+
 def main():
     N = 10000
     p = 0.01
@@ -41,10 +353,96 @@ def main():
     with open('tests/benchmark.txt', 'r') as f:
         inp = f.read().strip()
 
+    for args, digest in goldenDigests:
+        # Decompression decodes the output of the original implementation
+        outComp = Test(inp).run(args)
+        if hashlib.md5(outComp).hexdigest() != digest:
+            exit('Output of {} differs from the original'.format(args))
     test = Test(inp)
     test.run(['--prob1', str(p), '--N', str(N)])
     test = Test(inp)
     test.run(['--prob1', str(p), '--N', str(N), '--adaptive'])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--N', str(N), '--adaptive',
+              '--quantize', '64'])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--N', str(N), '--golomb'])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--N', str(N), '--adaptive', '--canonical'])
+    checkVectorized(inp, p, N)
+    checkVectorized(inp, 0.2, N)
+    pComp = Popen(['./squash', '--N', str(N), '--adaptive', '--vectorized'],
+                  stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    if pComp.communicate(inp)[1] == b'' or pComp.returncode == 0:
+        exit('Adaptive vectorized compression not rejected')
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--stream', '--adaptive', '--canonical'])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--N', str(N), '--adaptive',
+              '--block-size', '3000', '--jobs', '4'])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--N', str(N), '--container', '--adaptive',
+              '--block-size', '3000'])
+    for command in ['./squash', './unsquash']:
+        pComp = Popen([command, '--N', str(N), '--container', '--stream'],
+                      stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        if pComp.communicate(inp)[1] == b'' or pComp.returncode == 0:
+            exit('Streaming container not rejected')
+    test = Test(inp)
+    test.runRanges(['--prob1', str(p), '--N', str(N), '--adaptive',
+                    '--block-size', '3000'],
+                   [(0, 1), (N - 1, N), (2990, 3010), (N - 10, 2 * N),
+                    (N - 5, None), (N + 5, None), (100, 100)],
+                   [(-5, 20), (-1500, -1000), (20, 10)])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--stream', '--adaptive', '--flush',
+              'interactive'])
+    test = Test(inp)
+    test.run(['--prob1', str(p), '--N', str(N), '--flush', 'timed'])
+    test = Test(packBits(inp))
+    test.run(['--prob1', str(p), '--N', str(N), '--packed'])
+    test = Test(packBits(inp))
+    test.run(['--prob1', str(p), '--N', str(N), '--adaptive', '--packed'])
+    test = Test(packBits(inp))
+    test.run(['--prob1', str(p), '--stream', '--packed'])
+    test = Test(packBits(inp))
+    test.run(['--prob1', str(p), '--N', str(N), '--container', '--golomb',
+              '--packed'])
+    bank = os.path.join(tempfile.mkdtemp(), 'bank')
+    check_call(['./squash', '--build-bank', bank, '--quantize', '64'])
+    test = Test(inp)
+    test.run(['--N', str(N), '--adaptive', '--bank', bank, '--block-size',
+              '3000'])
+    os.remove(bank)
+    os.rmdir(os.path.dirname(bank))
+    test = Test(inp)
+    test.runServer(['--prob1', str(p), '--N', str(N), '--adaptive'])
+    checkServedFlags()
+    test = Test(inp)
+    test.runFiles(['--prob1', str(p), '--N', str(N), '--adaptive'])
+    test = Test(packBits(inp))
+    test.runFiles(['--prob1', str(p), '--container', '--packed'])
+    test = Test(packBits(inp))
+    test.runLibrary(prob1=p, adaptive=True, blockSize=3000)
+    test = Test(inp)
+    test.runLibrary(prob1=p, packed=False)
+    # Zero bytes become newlines, such that lines are read one by one
+    checkFile(packBits(inp).replace(b'\x00', b'\n'), prob1=p, adaptive=True)
+    test = Test(packBits(inp))
+    test.runGenerators(333, prob1=p, adaptive=True, chunkSize=100)
+    test = Test(inp)
+    test.runGenerators(777, prob1=p, packed=False, engine='canonical',
+                       chunkSize=100)
+    checkLengthDistribution(0.2, 10, prob1=0.1)
+    checkLengthDistribution(0.2, 10, adaptive=True)
+    checkCodeReuse(p, 1000)
+    checkBitLevelStreaming(inp)
+    checkStats()
+    checkTruncatedStream(packBits(inp), p)
+    checkBlockIndex(inp, p)
+    for args in [[], ['--adaptive'], ['--block-size', '3000', '--jobs', '2'],
+                 ['--container'], ['--golomb']]:
+        checkShortInput(args)
 
     sys.stderr.write('OK\n')
 
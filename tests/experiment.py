@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import zlib
+from multiprocessing import Pool, cpu_count
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arhc.cache import CodebookCache
+from arhc.container import Header
+from arhc.stream import Stream
+from harness import generateBits
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Cell:
+
+    """
+    Configuration of an experiment whose runs each compress and decompress
+    a random input in-process. The input of every run is generated from a
+    seed that depends on the base seed, p, N and the number of the run only,
+    such that all models compress the same inputs and a sweep is
+    reproducible whatever the order in which runs finish.
+
+    :param adaptive: Use the adaptive probability model.
+    :param p:        Probability of one of the input.
+    :param prob1:    Probability of one of the static model, or None for
+                     p.
+    :param alpha:    Pseudo-count of zero and of one of the adaptive model.
+    :param N:        Number of bits of the input.
+    :param runs:     Number of runs.
+    :param seed:     Base seed.
+    """
+
+    columns = ['model', 'p', 'prob1', 'alpha', 'N', 'run', 'seed',
+               'compressedBits', 'ratio']
+
+    def __init__(self, adaptive, p, prob1, alpha, N, runs, seed):
+        self.adaptive = adaptive
+        self.p = p
+        self.prob1 = p if prob1 is None else prob1
+        self.alpha = alpha
+        self.N = N
+        self.runs = runs
+        self.seed = seed
+
+    def getName(self):
+        return '{}-p{}-prob1{}-alpha{}-N{}-runs{}-seed{}'.format(
+            'adaptive' if self.adaptive else 'static', self.p, self.prob1,
+            self.alpha, self.N, self.runs, self.seed)
+
+    def getSeed(self, run):
+        """ Get the seed of the input of a run. """
+        key = '{}:{}:{}:{}'.format(self.seed, self.p, self.N, run)
+        return zlib.crc32(key.encode('ascii')) & 0xffffffff
+
+    def run(self, run, cache):
+        """ Compress and decompress the input of a run. """
+        seed = self.getSeed(run)
+        bits = generateBits(self.p, self.N, seed)
+        header = Header(self.N, self.adaptive, self.prob1, self.alpha,
+                        self.alpha)
+        output = StringIO()
+        header.createEngine(cache).compress(
+            Stream(StringIO(bits), self.N),
+            Stream(output, self.N, flush='throughput'))
+        code = output.getvalue()
+        output = StringIO()
+        header.createEngine(cache).decompress(
+            Stream(StringIO(code), self.N),
+            Stream(output, self.N, flush='throughput'))
+        if output.getvalue() != bits:
+            raise ValueError('decompressed output of {} run {} not '
+                             'consistent with input'.format(self.getName(),
+                                                            run))
+        return {
+            'model': 'adaptive' if self.adaptive else 'static',
+            'p': self.p,
+            'prob1': self.prob1,
+            'alpha': self.alpha,
+            'N': self.N,
+            'run': run,
+            'seed': seed,
+            'compressedBits': len(code),
+            'ratio': 1 - float(len(code)) / self.N
+        }
+
+
+# Symbol codes are reused by all runs of a worker, which does not change
+# the codes that are built
+cache = CodebookCache()
+
+
+def runTask(task):
+    cell, run = task
+    return cell.getName(), cell.run(run, cache)
+
+
+def loadCheckpoint(path):
+    """ Load the rows of the cells that finished, by the name of the cell. """
+    finished = {}
+    if path and os.path.isfile(path):
+        with open(path, 'r') as f:
+            for line in f:
+                # A line cut short by an interruption is run again
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                finished[entry['name']] = entry['rows']
+    return finished
+
+
+def summarize(name, rows):
+    ratios = [row['ratio'] for row in rows]
+    mean = sum(ratios) / len(ratios)
+    std = math.sqrt(sum((ratio - mean) ** 2 for ratio in ratios) /
+                    len(ratios))
+    sys.stderr.write('{:56} ratio {:.4f} +- {:.4f}\n'.format(name, mean, std))
+
+
+def writeCsv(path, rows):
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, Cell.columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def writeNpz(path, rows):
+    try:
+        import numpy as np
+    except ImportError:
+        exit('--npz requires NumPy')
+    np.savez(path, **dict((column, np.array([row[column] for row in rows]))
+                          for column in Cell.columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Seeded compression experiments on a pool of workers.')
+    parser.add_argument('--models', nargs='+', default=['static', 'adaptive'],
+                        choices=['static', 'adaptive'])
+    parser.add_argument('--p', type=float, nargs='+', default=[0.01])
+    parser.add_argument('--prob1', type=float, nargs='+',
+                        help='Probabilities of one of the static model, '
+                             'p by default')
+    parser.add_argument('--alpha', type=float, nargs='+', default=[0.5],
+                        help='Pseudo-counts of the adaptive model')
+    parser.add_argument('--N', type=int, nargs='+',
+                        default=[10, 50, 100, 200, 500, 1000, 5000, 10000])
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of workers, one per CPU by default')
+    parser.add_argument('--checkpoint',
+                        help='Record finished cells in this file and skip '
+                             'the cells it holds')
+    parser.add_argument('--csv', help='Write a row per run as CSV')
+    parser.add_argument('--npz', help='Write a column per field as NPZ')
+    args = parser.parse_args()
+
+    cells = [Cell(model == 'adaptive', p, prob1, alpha, N, args.runs,
+                  args.seed)
+             for model in args.models
+             for p in args.p
+             # The static model has no pseudo-counts and the adaptive model
+             # no probability of one
+             for prob1 in (args.prob1 or [None] if model == 'static' else
+                           [None])
+             for alpha in (args.alpha if model == 'adaptive' else [0.5])
+             for N in args.N]
+    finished = loadCheckpoint(args.checkpoint)
+    for cell in cells:
+        if cell.getName() in finished:
+            summarize(cell.getName(), finished[cell.getName()])
+
+    pending = dict((cell.getName(), []) for cell in cells
+                   if cell.getName() not in finished)
+    tasks = [(cell, run) for cell in cells if cell.getName() in pending
+             for run in range(cell.runs)]
+    pool = Pool(args.jobs)
+    checkpoint = open(args.checkpoint, 'a') if args.checkpoint else None
+    try:
+        # Runs are handed out in chunks to reduce communication
+        chunkSize = max(1, len(tasks) // (16 * (args.jobs or cpu_count())))
+        for name, row in pool.imap_unordered(runTask, tasks, chunkSize):
+            pending[name].append(row)
+            if len(pending[name]) < args.runs:
+                continue
+            rows = sorted(pending.pop(name), key=lambda row: row['run'])
+            finished[name] = rows
+            summarize(name, rows)
+            if checkpoint:
+                checkpoint.write(json.dumps({'name': name, 'rows': rows}) +
+                                 '\n')
+                checkpoint.flush()
+    finally:
+        if checkpoint:
+            checkpoint.close()
+        pool.terminate()
+
+    rows = [row for cell in cells for row in finished[cell.getName()]]
+    if args.csv:
+        writeCsv(args.csv, rows)
+    if args.npz:
+        writeNpz(args.npz, rows)
+
+
+if __name__ == '__main__':
+    main()
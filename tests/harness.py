@@ -0,0 +1,53 @@
+"""
+Harness shared by the benchmark and experiment scripts: seeded random inputs
+and a runner that measures every job in a fresh process.
+"""
+
+import math
+from multiprocessing import Pool
+from random import Random
+
+
+def generateBits(p, N, seed):
+    """ Generate N bits as a string of '0' and '1', each one with
+            probability p. """
+    random = Random(seed).random
+    return ''.join('1' if random() < p else '0' for _ in range(N))
+
+
+def generateChunks(p, N, seed, chunkSize):
+    """ Generate N packed bits, a multiple of eight, each one with
+            probability p, in chunks of chunkSize bytes. Only a chunk is
+            held at a time. """
+    random = Random(seed).random
+    scale = 1 / math.log(1 - p)
+
+    def gap():
+        # The number of zeros before a one is geometrically distributed
+        return int(math.log(1.0 - random()) * scale)
+
+    position = gap()
+    for start in range(0, N, 8 * chunkSize):
+        end = min(N, start + 8 * chunkSize)
+        chunk = bytearray((end - start) // 8)
+        while position < end:
+            offset = position - start
+            chunk[offset >> 3] |= 0x80 >> (offset & 7)
+            position += 1 + gap()
+        yield bytes(chunk)
+
+
+def runJob(job):
+    return job.run()
+
+
+def runFresh(jobs):
+    """ Run every job in a fresh process, such that its peak memory is its
+            own, and yield the results in order. """
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        for job in jobs:
+            yield pool.apply(runJob, (job,))
+    finally:
+        pool.close()
+        pool.join()
@@ -6,6 +6,9 @@ import sys
 from subprocess import Popen, PIPE
 from random import random
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arhc.analysis import LengthDistribution
+
 
 class Test:
 
@@ -54,6 +57,10 @@ def main():
     sys.stderr.write('Length:   {:.2f} +- {:.2f}\n'.format(mean(lens), std(lens)))
     sys.stderr.write('Overhead: {:.2f} +- {:.2f}\n'.format(mean(map(lambda x: x - lenOpt, lens)), std(lens)))
 
+    lenMean, lenVar = LengthDistribution().calculate(p, N, prob1=p)
+    sys.stderr.write('Exact:    {:.2f} +- {:.2f}\n'.format(lenMean, math.sqrt(lenVar)))
+    sys.stderr.write('Exact overhead: {:.2f}\n'.format(lenMean - lenOpt))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arhc.cache import CodebookCache
+from arhc.codec import iterCompress, iterDecompress
+from harness import generateChunks, runFresh
+
+
+class Pipeline:
+
+    """
+    Compression and decompression of a seeded random input of packed bits
+    through iterCompress and iterDecompress, of which the peak memory is
+    measured in a fresh process. The input is generated chunk by chunk and
+    compared with the output by digest, so that nothing holds all bits.
+    What remains is bounded by the chunk size and the symbol codes cached
+    by either end.
+
+    :param adaptive:  Use the adaptive probability model.
+    :param p:         Probability of one of the input.
+    :param N:         Number of bits of the input, a multiple of eight.
+    :param seed:      Seed of the input.
+    :param chunkSize: Number of bytes per chunk.
+    :param cacheSize: Maximum number of symbol codes cached by either end.
+    """
+
+    def __init__(self, adaptive, p, N, seed, chunkSize, cacheSize):
+        self.adaptive = adaptive
+        self.p = p
+        self.N = N
+        self.seed = seed
+        self.chunkSize = chunkSize
+        self.cacheSize = cacheSize
+
+    def getName(self):
+        return '{}-p{}-N{}'.format('adaptive' if self.adaptive else 'static',
+                                   self.p, self.N)
+
+    def generate(self, digest):
+        """ Generate the input in chunks, updating a digest with them. """
+        for chunk in generateChunks(self.p, self.N, self.seed,
+                                    self.chunkSize):
+            digest.update(chunk)
+            yield chunk
+
+    def run(self):
+        inDigest, outDigest = hashlib.md5(), hashlib.md5()
+        options = {'adaptive': self.adaptive, 'prob1': self.p,
+                   'chunkSize': self.chunkSize}
+        counts = {'code': 0}
+
+        def count(chunks):
+            for chunk in chunks:
+                counts['code'] += len(chunk)
+                yield chunk
+
+        start = time.time()
+        size = 0
+        chunks = iterCompress(self.generate(inDigest),
+                              cache=CodebookCache(self.cacheSize), **options)
+        for chunk in iterDecompress(count(chunks),
+                                    cache=CodebookCache(self.cacheSize),
+                                    **options):
+            outDigest.update(chunk)
+            size += len(chunk)
+        elapsed = time.time() - start
+        if size * 8 != self.N or inDigest.digest() != outDigest.digest():
+            exit('Decompressed output not consistent with input')
+        return {
+            'name': self.getName(),
+            'adaptive': self.adaptive,
+            'p': self.p,
+            'N': self.N,
+            'seed': self.seed,
+            'compressedBytes': counts['code'],
+            'seconds': elapsed,
+            'bitsPerSecond': self.N / elapsed,
+            'peakMemoryKiB': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Peak memory of the generator pipeline across N.')
+    parser.add_argument('--adaptive', action='store_true')
+    parser.add_argument('--p', type=float, default=0.001)
+    parser.add_argument('--N', type=float, nargs='+',
+                        default=[1e6, 1e7, 1e8, 1e9])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1 << 16)
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Maximum number of symbol codes cached by '
+                             'either end')
+    parser.add_argument('--slack', type=int, default=8192,
+                        help='Growth of the peak memory in KiB beyond that '
+                             'of the smallest N that is allowed')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    pipelines = [Pipeline(args.adaptive, args.p, int(N) // 8 * 8, args.seed,
+                          args.chunk_size, args.cache_size)
+                 for N in sorted(args.N)]
+    # A fresh process per N isolates its peak memory
+    results = []
+    for result in runFresh(pipelines):
+        sys.stderr.write('{:32} {:10.0f} bits/s, {:10} compressed bytes, '
+                         'peak memory {} KiB\n'.format(
+                             result['name'], result['bitsPerSecond'],
+                             result['compressedBytes'],
+                             result['peakMemoryKiB']))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    limit = results[0]['peakMemoryKiB'] + args.slack
+    for result in results[1:]:
+        if result['peakMemoryKiB'] > limit:
+            exit('Peak memory of {} KiB for N = {} exceeds {} KiB'.format(
+                result['peakMemoryKiB'], result['N'], limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import threading
+import time
+from random import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arhc.service import Client, CompressionService, SessionError
+
+
+def bitString(N, p):
+    return ''.join(map(lambda x: '0' if x > p else '1',
+                       [random() for _ in range(N)]))
+
+
+def chunked(bits, size=997):
+    return [bits[i:i + size] for i in range(0, len(bits), size)]
+
+
+class Test:
+
+    def __init__(self, client, bits, parameters):
+        self.client = client
+        self.bits = bits
+        self.parameters = parameters
+        self.error = None
+
+    def run(self):
+        try:
+            code = self.client.compress(chunked(self.bits), **self.parameters)
+            outDecomp = self.client.decompress(chunked(code),
+                                               **self.parameters)
+            if outDecomp != self.bits:
+                self.error = 'Decompressed output not consistent with input'
+        except Exception as e:
+            self.error = str(e)
+
+
+def main():
+    service = CompressionService(('127.0.0.1', 0), maxSessions=16,
+                                 sessionTimeout=1.0, memoryCap=1 << 16)
+    thread = threading.Thread(target=service.serve_forever)
+    thread.daemon = True
+    thread.start()
+    client = Client(service.server_address)
+
+    # Many concurrent sessions, each with its own model
+    tests = [Test(client, bitString(20000, p), {'adaptive': adaptive,
+                                                'prob1': p})
+             for p in [0.005, 0.01, 0.05] for adaptive in [False, True]]
+    threads = [threading.Thread(target=test.run) for test in tests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for test in tests:
+        if test.error:
+            exit(test.error)
+
+    # Bits are compressed as they arrive
+    connection, _ = client.connect({'mode': 'compress', 'prob1': 0.5})
+    connection.sendall(b'0101010101')
+    connection.settimeout(5.0)
+    if not connection.recv(1 << 10):
+        exit('No output before the end of the input')
+    connection.close()
+
+    # Idle sessions time out
+    connection, _ = client.connect({'mode': 'compress'})
+    time.sleep(1.5)
+    connection.close()
+
+    # Unknown parameters are refused
+    try:
+        client.compress(['0101'], flush='bogus')
+        exit('Unknown flush policy accepted')
+    except SessionError:
+        pass
+
+    # Models that would not fit in the memory of a session are refused
+    for parameters in [{'prob1': 0}, {'prob1': 1}, {'prob1': 1e-9},
+                       {'adaptive': True, 'alpha1': 0},
+                       {'adaptive': True, 'alpha0': 1e9}]:
+        try:
+            client.compress(['0101'], **parameters)
+            exit('Parameters {} accepted'.format(parameters))
+        except SessionError:
+            pass
+
+    states = [session['state'] for session in client.getMetrics()]
+    if states.count('done') < 2 * len(tests) or 'timed out' not in states:
+        exit('Unexpected session states {}'.format(states))
+
+    service.shutdown()
+    service.server_close()
+    sys.stderr.write('OK\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arhc.container import Header
+from arhc.stream import Stream
+from harness import generateBits, runFresh
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Benchmark:
+
+    """
+    In-process measurement of the compression and decompression of a
+    seeded random input, run in a fresh process such that its peak memory
+    can be measured.
+
+    :param adaptive: Use the adaptive probability model.
+    :param p:        Probability of one of the input.
+    :param N:        Number of bits of the input.
+    :param seed:     Seed of the input.
+    :param repeat:   Minimum number of repetitions, of which the fastest is
+                     reported. Short benchmarks are repeated for at least
+                     minTime seconds.
+    """
+
+    minTime = 0.5
+
+    def __init__(self, adaptive, p, N, seed, repeat):
+        self.adaptive = adaptive
+        self.p = p
+        self.N = N
+        self.seed = seed
+        self.repeat = repeat
+
+    def getName(self):
+        return '{}-p{}-N{}'.format('adaptive' if self.adaptive else 'static',
+                                   self.p, self.N)
+
+    def measure(self, header, method, contents):
+        best, latencies, total, runs = None, [], 0.0, 0
+        while runs < self.repeat or total < self.minTime:
+            times = []
+            output = StringIO()
+            inStream = Stream(StringIO(contents), self.N)
+            outStream = Stream(output, self.N, flush='throughput')
+            outStream.observeWrite(lambda x: times.append(time.time()))
+            engine = header.createEngine()
+            start = time.time()
+            getattr(engine, method)(inStream, outStream)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+            total += elapsed
+            runs += 1
+            # Every symbol is written to the output separately
+            latencies += [b - a for a, b in zip([start] + times, times)]
+        return best, latencies, output.getvalue()
+
+    def run(self):
+        bits = generateBits(self.p, self.N, self.seed)
+        rssBefore = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        header = Header(self.N, self.adaptive, self.p)
+        compressTime, compressLatencies, code = self.measure(
+            header, 'compress', bits)
+        decompressTime, decompressLatencies, output = self.measure(
+            header, 'decompress', code)
+        if output != bits:
+            exit('Decompressed output not consistent with input')
+
+        rssAfter = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            'name': self.getName(),
+            'adaptive': self.adaptive,
+            'p': self.p,
+            'N': self.N,
+            'seed': self.seed,
+            'compressedBits': len(code),
+            'compressBitsPerSecond': self.N / compressTime,
+            'decompressBitsPerSecond': self.N / decompressTime,
+            'compressLatencyUs': percentiles(compressLatencies),
+            'decompressLatencyUs': percentiles(decompressLatencies),
+            'peakMemoryKiB': rssAfter,
+            'memoryKiB': rssAfter - rssBefore
+        }
+
+
+def percentiles(latencies, points=(50, 90, 99)):
+    latencies = sorted(latencies) or [0.0]
+    last = len(latencies) - 1
+    return dict((str(point), 1e6 * latencies[min(last, last * point // 100)])
+                for point in points)
+
+
+def compare(results, baseline, tolerance):
+    baseline = dict((result['name'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        if result['name'] not in baseline:
+            continue
+        for key in ['compressBitsPerSecond', 'decompressBitsPerSecond']:
+            old, new = baseline[result['name']][key], result[key]
+            change = new / old - 1
+            flag = 'REGRESSION' if change < -tolerance else ''
+            sys.stderr.write('{:32} {:24} {:12.0f} {:12.0f} {:+7.1%} {}\n'
+                             .format(result['name'], key, old, new, change,
+                                     flag))
+            if flag:
+                regressions.append((result['name'], key))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='In-process throughput and latency benchmarks.')
+    parser.add_argument('--p', type=float, nargs='+',
+                        default=[0.001, 0.01, 0.1])
+    parser.add_argument('--N', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--compare', help='Compare with results in JSON')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    benchmarks = [Benchmark(adaptive, p, N, args.seed, args.repeat)
+                  for adaptive in [False, True]
+                  for p in args.p
+                  for N in args.N]
+    # A fresh process per benchmark isolates its peak memory
+    results = []
+    for result in runFresh(benchmarks):
+        sys.stderr.write(
+            '{:32} compress {:10.0f} bits/s, decompress {:10.0f} bits/s, '
+            'peak memory {} KiB\n'.format(
+                result['name'], result['compressBitsPerSecond'],
+                result['decompressBitsPerSecond'], result['peakMemoryKiB']))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            exit('{} regressions'.format(len(regressions)))
+
+
+if __name__ == '__main__':
+    main()